@@ -0,0 +1,102 @@
+import math
+
+import numpy as np
+from django.db import connections
+
+from .models import History_chunk
+
+#steps of one series written as one row
+CHUNK_STEPS = 256
+
+
+#typed array of a histogram or curve for a BinaryField, with its dtype stored next to it
+def to_binary(values, dtype=None):
+    return np.ascontiguousarray(values, dtype=dtype).tobytes()
+
+
+def from_binary(values, dtype):
+    return np.frombuffer(bytes(values), dtype=dtype)
+
+
+#Buffers per step values of a run and writes them as chunks of CHUNK_STEPS steps, one bulk insert per chunk
+#simulation jobs feed it from their on_step hook (see job_queue.run_job), close writes the steps left when the run ends
+class History_writer:
+    def __init__(self, session_id, run_id, chunk_steps=CHUNK_STEPS):
+        self.session_id = session_id
+        self.run_id = run_id
+        self.chunk_steps = chunk_steps
+        self.start_step = None
+        self.buffer = {}
+
+    #values {series name: value} of one step, steps have to come in order
+    def add_step(self, step, values):
+        if self.start_step is None:
+            self.start_step = step
+        for series, value in values.items():
+            self.buffer.setdefault(series, []).append(value)
+        if step - self.start_step + 1 >= self.chunk_steps:
+            self.flush()
+
+    def flush(self):
+        chunks = []
+        for series, values in self.buffer.items():
+            values = np.asarray(values)
+            values = values.astype(np.int64 if np.issubdtype(values.dtype, np.integer) else np.float64)
+            chunks.append(History_chunk(session_id=self.session_id, run_id=self.run_id, series=series, start_step=self.start_step,
+                                        end_step=self.start_step + values.size, dtype=values.dtype.str, values=to_binary(values)))
+        History_chunk.objects.bulk_create(chunks)
+        self.start_step = None
+        self.buffer = {}
+        return len(chunks)
+
+    def close(self):
+        if self.buffer:
+            self.flush()
+
+
+#initializer of the simulation worker processes, which write the history of their runs
+#database connections copied from the forked web process are dropped without closing them, the worker opens its own
+def init_history_worker():
+    for worker_connection in connections.all(initialized_only=True):
+        worker_connection.connection = None
+
+
+#latest run with history of the session, None if there is none
+def get_last_run(session_id):
+    chunk = History_chunk.objects.filter(session_id=session_id).order_by('-id').only('run_id').first()
+    return chunk.run_id if chunk is not None else None
+
+
+def get_run_series(session_id, run_id):
+    return sorted(set(History_chunk.objects.filter(session_id=session_id, run_id=run_id).values_list('series', flat=True)))
+
+
+#steps in [start, stop) of the run's series, only chunks overlapping the range are read
+#every n-th step is returned, max_points chooses n so that at most max_points steps are returned
+#returns the step numbers and {series name: values}
+def get_history(session_id, run_id, series=None, start=0, stop=None, every=1, max_points=None):
+    chunks = History_chunk.objects.filter(session_id=session_id, run_id=run_id, end_step__gt=start)
+    if stop is not None:
+        chunks = chunks.filter(start_step__lt=stop)
+    if series is not None:
+        chunks = chunks.filter(series__in=series)
+
+    values = {}
+    for chunk in chunks.order_by('series', 'start_step'):
+        values.setdefault(chunk.series, []).append((chunk.start_step, from_binary(chunk.values, chunk.dtype)))
+    if not values:
+        return np.arange(0), {}
+
+    first = max(start, min(parts[0][0] for parts in values.values()))
+    last = min(parts[-1][0] + parts[-1][1].size for parts in values.values())
+    if stop is not None:
+        last = min(last, stop)
+    if max_points is not None and last > first:
+        every = max(every, math.ceil((last - first)/max_points))
+    steps = np.arange(first, max(first, last), every)
+    series_values = {}
+    for name, parts in values.items():
+        offset = parts[0][0]
+        curve = np.concatenate([part for start_step, part in parts])
+        series_values[name] = curve[steps - offset]
+    return steps, series_values
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('demo', '0009_auto_20200103_0004'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='History_chunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(db_index=True, max_length=64)),
+                ('run_id', models.CharField(max_length=32)),
+                ('series', models.CharField(max_length=150)),
+                ('start_step', models.IntegerField()),
+                ('end_step', models.IntegerField()),
+                ('dtype', models.CharField(max_length=8)),
+                ('values', models.BinaryField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='history_chunk',
+            index=models.Index(fields=['session_id', 'run_id', 'series', 'start_step'], name='demo_histor_session_f1e4bd_idx'),
+        ),
+    ]
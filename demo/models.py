@@ -127,6 +127,20 @@ class Bank_state(models.Model):
     min_irates = models.TextField()
 
 
+#consecutive steps of one per step series of a simulation run, values are a typed binary array
+class History_chunk(models.Model):
+    session_id = models.CharField(max_length=64, db_index=True)
+    run_id = models.CharField(max_length=32)
+    series = models.CharField(max_length=150)
+    start_step = models.IntegerField()
+    end_step = models.IntegerField()
+    dtype = models.CharField(max_length=8)
+    values = models.BinaryField()
+
+    class Meta:
+        indexes = [models.Index(fields=['session_id', 'run_id', 'series', 'start_step'])]
+
+
 class Applicant(models.Model):
     group = models.ForeignKey(Group_state, on_delete=models.CASCADE)
     score = models.IntegerField()
@@ -1,70 +1,118 @@
 import numpy as np
-import random
-import matplotlib.pyplot as plt
 from demo.src.applicant import Applicant
+from demo.src.score_order import Score_order
 
 class Applicant_group:
-    def __init__(self, name, color, line_style, size, scores, loan_demand, error_rate, score_error, market, repays, ir_limit=np.inf):
+    def __init__(self, name, color, line_style, size, scores, loan_demand, error_rate, score_error, market, repays, ir_limit=np.inf, rng=None):
         self.name = name
         self.color = color
         self.line_style = line_style
         self.size = size
         self.loan_demand = loan_demand
+        #numpy Generator used for all random draws of the group
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.score_range = market.score_range
         self.score_repay_prob = self.get_repay_prob_mapping(market.score_range, repays)
         self.initial_mean_score = np.mean(scores)
         
         real_scores = self.set_real_scores(scores, error_rate, score_error, market)
-        self.applicants = self.create_applicants(scores, real_scores, ir_limit)
+        self.create_applicants(scores, real_scores, ir_limit)
         self.sort_by_score()
     
-    #Creates applicant objects and initializes them
+    #Creates population arrays with one entry per applicant, Applicant objects are only views into them
     def create_applicants(self, scores, real_scores, ir_limit):
-        applicants = []
-        for i in range (0, self.size):
-            applicants.append(Applicant(self, scores[i], real_scores[i], ir_limit))
-        return applicants
-    
+        self.scores = np.array(scores[:self.size], dtype=np.int32)
+        self.real_scores = np.array(real_scores[:self.size], dtype=np.int32)
+        self.repay_probs = self.get_repay_probs(self.scores)
+        self.real_repay_probs = self.get_repay_probs(self.real_scores)
+        self.ir_limits = np.full(self.size, ir_limit, dtype=float)
+        self.score_order = Score_order(self.scores, self.score_range)
+        return self.size
+
+    #population arrays for checkpoints, the score order is derived from them
+    def get_state(self):
+        return {'scores': self.scores, 'real_scores': self.real_scores, 'repay_probs': self.repay_probs,
+                'real_repay_probs': self.real_repay_probs, 'ir_limits': self.ir_limits, 'initial_mean_score': np.array(self.initial_mean_score)}
+
+    def set_state(self, state):
+        self.scores = np.array(state['scores'], dtype=np.int32)
+        self.real_scores = np.array(state['real_scores'], dtype=np.int32)
+        self.repay_probs = np.array(state['repay_probs'], dtype=float)
+        self.real_repay_probs = np.array(state['real_repay_probs'], dtype=float)
+        self.ir_limits = np.array(state['ir_limits'], dtype=float)
+        self.size = self.scores.size
+        self.initial_mean_score = float(state['initial_mean_score'])
+        self.score_order = Score_order(self.scores, self.score_range)
+        self.sort_by_score()
+        return self.size
+
+    def get_applicant(self, index):
+        return Applicant(self, index)
+
+    #keeps applicants in descending score order, ties keep their previous order
     def sort_by_score(self):
-        self.applicants.sort(key=lambda x: x.score, reverse=True)
-        return self.applicants
+        if self.score_order.is_sorted():
+            return self.scores
+        order = self.score_order.get_descending_order(self.scores)
+        self.scores = self.scores[order]
+        self.real_scores = self.real_scores[order]
+        self.repay_probs = self.repay_probs[order]
+        self.real_repay_probs = self.real_repay_probs[order]
+        self.ir_limits = self.ir_limits[order]
+        return self.scores
         
+    #repay probability of every score of the score range, index 0 = lowest score
+    #the table is precomputed by the FICO data cache and shared read only between groups
     def get_repay_prob_mapping(self, score_range, repay_prob):
-        x_axis = np.linspace(score_range[0],score_range[1],score_range[1]-score_range[0]+1, dtype=int)
-        y_axis = np.interp(x_axis, repay_prob.index, repay_prob[self.name])
-        return dict(zip(x_axis, y_axis))
-    
+        return repay_prob.get_repay_prob_mapping(self.name, score_range)
+
+    def get_repay_probs(self, scores):
+        return self.score_repay_prob[scores - self.score_range[0]]
     
     #simulating that some members of the group have better score/repay prob than rated
     def set_real_scores(self, scores, error_rate, score_error, market):
-        real_scores = scores.copy()
-        better_applicants = np.sort(random.sample(range(0, self.size), int(self.size*error_rate)))
-        for applicant in better_applicants:
-            if real_scores[applicant] + score_error < market.score_range[0]:
-                real_scores[applicant] = market.score_range[0]
-            elif real_scores[applicant] + score_error > market.score_range[1]:
-                real_scores[applicant] = market.score_range[1]
-            else:
-                real_scores[applicant] += score_error
+        real_scores = np.array(scores, dtype=np.int32)
+        better_applicants = self.rng.choice(self.size, int(self.size*error_rate), replace=False)
+        real_scores[better_applicants] = np.clip(real_scores[better_applicants] + score_error, market.score_range[0], market.score_range[1])
         return real_scores
+
+    #get simulated real repay outcomes of applicants at given positions(1=repaid, 0=default ) and change their scores accordingly
+    def get_repay_outcomes(self, market, applicants):
+        random_numbers = self.rng.random(len(applicants))
+        outcomes = (random_numbers >= 1-self.real_repay_probs[applicants]).astype(int)
+        self.update_scores(market, applicants, outcomes)
+        return outcomes
+
+    #change scores and real scores of applicants at given positions according to their repay outcomes(1=repaid, 0=default )
+    #repay probabilities keep the values of the initial scores
+    def update_scores(self, market, applicants, outcomes):
+        applicants = np.asarray(applicants, dtype=np.intp)
+        score_changes = np.where(outcomes, market.repay_score, market.default_score)
+        old_scores = self.scores[applicants]
+        self.scores[applicants] = np.clip(old_scores + score_changes, market.score_range[0], market.score_range[1])
+        self.score_order.move(old_scores, self.scores[applicants])
+        self.real_scores[applicants] = np.clip(self.real_scores[applicants] + score_changes, market.score_range[0], market.score_range[1])
+        return self.scores[applicants]
     
+    #read only view, the population arrays are changed by the group only
     def get_scores(self):
-        return list(applicant.score for applicant in self.applicants)
+        scores = self.scores.view()
+        scores.flags.writeable = False
+        return scores
+
+    #scores in descending order and the number of applicants behind each of them, one entry per applicant
+    def get_score_entries(self):
+        return self.scores, np.ones(self.size)
         
     def get_mean_score_change(self):
-        return np.mean(self.get_scores())-self.initial_mean_score
+        return self.score_order.get_mean_score()-self.initial_mean_score
 
     def toJSON(self):
             return json.dumps(self, default=lambda o: o.__dict__, sort_keys=True, indent=4)
 
     def plot_histogram(self, market):
-        plt.figure()
-        plt.hist(self.get_scores(), range = market.score_range, label='Step ' + str(market.step))
-        plt.ylabel("Occurence")
-        plt.xlabel("Score")
-        plt.ylim([0,self.size*0.75])
-        plt.legend(loc="upper left")
-        plt.show()
-        return 1
+        from demo.src import plotting
+        return plotting.plot_histogram(self, market)
         
     def __str__(self):
         return str(self.__class__) + ": " + str(self.__dict__)
@@ -1,5 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 class Bank:
     def __init__(self, name, color, line_style, interest_rate_range, market, interest_change_up=0.01, interest_change_down=-0.01, score_shift=0, utility_repaid=1, utility_default= -4):
@@ -13,7 +12,9 @@ class Bank:
         self.utility_repaid = utility_repaid
         self.utility_default = utility_default
 
-        self.score_interest_rates = {}
+        #interest rate of every score of the market score range, index 0 = lowest score
+        self.score_range = market.score_range
+        self.score_interest_rates = np.zeros(market.score_range[1]-market.score_range[0]+1)
         self.set_i_rates_mapping(market)
         self.expected_group_utility_curve = {}
         self.group_selection_rate = {}
@@ -24,8 +25,9 @@ class Bank:
         
     def set_i_rates_mapping(self, market):
         x_axis = np.linspace(market.score_range[0],market.score_range[1],market.score_range[1]-market.score_range[0]+1, dtype=int)
-        y_axis = np.interp(x_axis, market.score_range, self.interest_rate_range)   
-        self.score_interest_rates = dict(zip(x_axis, np.around(y_axis,4)))
+        y_axis = np.interp(x_axis, market.score_range, self.interest_rate_range)
+        #updated in place, so the table can be shared with batched kernels
+        np.around(y_axis, 4, out=self.score_interest_rates)
         return self.score_interest_rates
     
     def get_expected_applicant_score(self, market, applicant_score):
@@ -39,7 +41,9 @@ class Bank:
         return expected_applicant_score
     
     def get_applicant_evaluation_utility(self, expected_applicant_score, applicant_group):
-        return self.utility_default*(1-applicant_group.score_repay_prob[expected_applicant_score]) + (self.utility_repaid+self.score_interest_rates[expected_applicant_score])*applicant_group.score_repay_prob[expected_applicant_score]
+        repay_prob = applicant_group.score_repay_prob[expected_applicant_score - self.score_range[0]]
+        interest_rate = self.score_interest_rates[expected_applicant_score - self.score_range[0]]
+        return self.utility_default*(1-repay_prob) + (self.utility_repaid+interest_rate)*repay_prob
     
     def get_applicant_utility(self, interest_rate, outcome):
         utility = 0
@@ -61,20 +65,14 @@ class Bank:
         return self.interest_rate_range
     
     def change_interest_rate_range(self, score_interest_rates, market):
-        self.score_interest_rates = score_interest_rates
-        self.interest_rate_range = [score_interest_rates[market.score_range[0]],score_interest_rates[market.score_range[1]]]
+        self.score_interest_rates[:] = score_interest_rates
+        self.interest_rate_range = [self.score_interest_rates[0], self.score_interest_rates[-1]]
 
         return self.interest_rate_range
 
     def plot_expected_group_utility_curve(self, applicant_group):
-        plt.plot(list(range(0, len(self.expected_group_utility_curve[applicant_group.name]))), self.expected_group_utility_curve[applicant_group.name], color='black',LineStyle=':', label="expected bank utility curve")
-        plt.ylabel('Utility')
-        plt.xlabel('Applicants')
-        plt.title('Expected utility curve of ' + self.name + ' bank for ' + applicant_group.name + ' group')
-        plt.grid('on')
-        plt.legend(loc="lower left")
-        #plt.show()
-        return 1
+        from demo.src import plotting
+        return plotting.plot_expected_group_utility_curve(self, applicant_group)
     
     def set_selection_rate(self, selection_rates):
         for group_name, selection_rate in selection_rates.items():
@@ -0,0 +1,240 @@
+#benchmarks of the simulation engine and the threshold solvers on synthetic scenarios, no database is needed
+#run from the project directory: python -m demo.src.benchmark --quick
+#--save writes the results, --baseline compares to a results file of the same machine, e.g. one saved before a change
+#demo/benchmark_baseline.json is a full run on the development machine, kept as a reference of the expected magnitudes
+#every simulation case runs in a fresh process, so its peak memory is its own
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+from demo.src.scenario import complete_scenario, BANK_DEFAULTS
+
+POLICIES = {'MU': "Max. utility", 'DP': "Dem. parity", 'EO': "Equal opportunity"}
+SIZES = (1000, 10000, 100000, 1000000)
+BANK_COUNTS = (2, 10, 50)
+QUICK_SIZES = (1000, 10000)
+QUICK_BANK_COUNTS = (2, 10)
+
+#a case stops after its steps or when a step ends later than this, large cases of the slow policies report fewer steps
+STEPS = 10
+MAX_SECONDS = 30
+#slower than the baseline by more than this fraction is reported as a regression
+TOLERANCE = 0.25
+
+BANK_COLORS = ("red", "blue", "green", "orange", "purple", "brown", "pink", "olive", "cyan", "grey")
+
+
+#groups of the given size each and banks spread around the default rates and score shifts
+def get_synthetic_scenario(size, banks, policy="Max. utility"):
+    bank_settings = []
+    for k in range(banks):
+        position = k/(banks - 1) if banks > 1 else 0.5
+        bank_settings.append(dict(name="bank " + str(k + 1), color=BANK_COLORS[k % len(BANK_COLORS)],
+                                  low_score_interest_rate=round(BANK_DEFAULTS['low_score_interest_rate'] + 0.06*(position - 0.5), 4),
+                                  high_score_interest_rate=round(BANK_DEFAULTS['high_score_interest_rate'] - 0.02*(position - 0.5), 4),
+                                  score_shift=int(round(50*(position - 0.5)))))
+    return complete_scenario({
+        'market': dict(policy=policy),
+        'banks': bank_settings,
+        'groups': [dict(name="White", color="grey", size=size, score_error=-150),
+                   dict(name="Black", color="black", line_style=':', size=size, score_error=150)],
+    })
+
+
+def get_case_name(policy, size, banks):
+    return 'run_oligopoly/' + policy + '/size=' + str(size) + '/banks=' + str(banks)
+
+
+def get_cases(sizes=SIZES, bank_counts=BANK_COUNTS, policies=tuple(POLICIES)):
+    return [(policy, size, banks) for policy in policies for size in sizes for banks in bank_counts]
+
+
+#peak resident memory of the process in MB (ru_maxrss is in kB on Linux and in bytes on macOS)
+def get_peak_memory():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/(1024*1024 if os.uname().sysname == 'Darwin' else 1024)
+
+
+#worker of run_case, steps are run one at a time so a case can stop after its time budget
+def measure_case(policy, size, banks, steps, max_seconds, seed):
+    from demo.src.simulation import Simulation
+
+    started = time.perf_counter()
+    simulation = Simulation(scenario=get_synthetic_scenario(size, banks, POLICIES[policy]), seed=seed, verbose=False, profile=True)
+    setup_seconds = time.perf_counter() - started
+    setup_memory = get_peak_memory()
+
+    started = time.perf_counter()
+    steps_run = 0
+    while steps_run < steps and (steps_run == 0 or time.perf_counter() - started < max_seconds):
+        simulation.run_oligopoly(1)
+        steps_run += 1
+    seconds = time.perf_counter() - started
+
+    report = simulation.get_profile_report()
+    return {'policy': POLICIES[policy], 'size': size, 'banks': banks, 'steps': steps_run, 'seconds': seconds,
+            'steps_per_second': steps_run/seconds, 'setup_seconds': setup_seconds,
+            'setup_memory_mb': setup_memory, 'peak_memory_mb': get_peak_memory(),
+            'phases': {name: phase['total']/steps_run for name, phase in report['phases'].items()},
+            'counters': {name: number/steps_run for name, number in report['counters'].items()}}
+
+
+def run_case(policy, size, banks, steps=STEPS, max_seconds=MAX_SECONDS, seed=0):
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+        return executor.submit(measure_case, policy, size, banks, steps, max_seconds, seed).result()
+
+
+#best and mean time of repeated calls, setup builds fresh arguments for every call and is not timed
+def time_call(function, setup=lambda: ((), {}), repeat=5):
+    times = []
+    for i in range(repeat):
+        args, kwargs = setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            function(*args, **kwargs)
+            times.append(time.perf_counter() - started)
+    return {'seconds': min(times), 'mean_seconds': sum(times)/len(times), 'repeat': repeat}
+
+
+#inputs of the threshold solvers built from the FICO data, the same the outcome curve notebooks use
+def get_solver_data(group_names=("Black", "White"), data_dir='demo/data/'):
+    import demo.src.fico as fico
+    import demo.src.support_functions as sf
+
+    fico_data = fico.load_FICO_data(data_dir=data_dir)
+    scores = np.array(fico_data.cdf_scores)
+    cdfs = fico_data.get_cdfs(group_names)
+    pis = np.vstack([sf.get_pmf(cdf) for cdf in cdfs])
+    perf = np.vstack([fico_data.performance[:, fico_data.groups.index(name)] for name in group_names])
+    totals = fico_data.get_totals()
+    group_ratio = np.array([totals[name] for name in group_names])
+    loan_repaid_probs = [lambda x, i=i: perf[i, np.abs(scores - x).argmin()] for i in range(len(group_names))]
+    return {'scores': scores, 'cdfs': cdfs, 'pis': pis, 'perf': perf, 'group_size_ratio': group_ratio/group_ratio.sum(),
+            'loan_repaid_probs': loan_repaid_probs, 'utils': (-4, 1), 'impacts': [-150, 75]}
+
+
+def run_micro_benchmarks(repeat=5):
+    import demo.src.solve_credit as sc
+    import demo.src.distribution_to_loans_outcomes as dlo
+
+    data = get_solver_data()
+    scores, pis, perf, ratio, utils = data['scores'], data['pis'], data['perf'], data['group_size_ratio'], data['utils']
+    break_even = utils[0]/(utils[0] - utils[1])
+    fairness_data = sc.fairness_data(perf, pis, ratio, break_even)
+    loan_repay_fns = data['loan_repaid_probs']
+    util = dlo.get_utility_curve(loan_repay_fns, pis, scores, utils)
+
+    benchmarks = {
+        'solve_credit/max_profit_loans': (fairness_data.max_profit_loans,),
+        'solve_credit/demographic_loans': (fairness_data.demographic_loans,),
+        'solve_credit/equal_opp_loans': (fairness_data.equal_opp_loans,),
+        'solve_credit/loans_from_tp': (fairness_data.loans_from_tp, lambda: ((0.8,), {})),
+        'distribution_to_loans_outcomes/get_thresholds':
+            (dlo.get_thresholds, lambda: ((data['loan_repaid_probs'], pis, ratio, utils, data['impacts'], scores), {})),
+        'distribution_to_loans_outcomes/get_outcome_curve':
+            (dlo.get_outcome_curve, lambda: ((loan_repay_fns[0], pis[0], scores, data['impacts']), {})),
+        'distribution_to_loans_outcomes/get_utility_curve':
+            (dlo.get_utility_curve, lambda: ((loan_repay_fns, pis, scores, utils), {})),
+        'distribution_to_loans_outcomes/get_utility_curves_dempar':
+            (dlo.get_utility_curves_dempar, lambda: ((util, data['cdfs'].copy(), ratio, scores), {})),
+        'distribution_to_loans_outcomes/get_utility_curves_eqopp':
+            (dlo.get_utility_curves_eqopp, lambda: ((util, data['loan_repaid_probs'], pis, ratio, scores), {})),
+    }
+    return {name: time_call(*benchmark, repeat=repeat) for name, benchmark in benchmarks.items()}
+
+
+#results {name: measurements}, every case is printed when it is done
+def run_benchmarks(cases, steps=STEPS, max_seconds=MAX_SECONDS, micro=True, repeat=5, seed=0, out=print):
+    results = {}
+    for policy, size, banks in cases:
+        name = get_case_name(policy, size, banks)
+        results[name] = run_case(policy, size, banks, steps, max_seconds, seed)
+        out(format_result(name, results[name]))
+    if micro:
+        for name, result in run_micro_benchmarks(repeat).items():
+            results[name] = result
+            out(format_result(name, result))
+    return results
+
+
+def format_result(name, result):
+    if 'steps_per_second' not in result:
+        return '%-62s %10.4f ms' % (name, 1000*result['seconds'])
+    phases = ', '.join(name.split('/')[0] + ' %.4f' % seconds for name, seconds in result['phases'].items())
+    return '%-62s %10.2f steps/s %9.1f MB  (%s)' % (name, result['steps_per_second'], result['peak_memory_mb'], phases)
+
+
+#the benchmark speed, higher is better
+def get_speed(result):
+    return result['steps_per_second'] if 'steps_per_second' in result else 1/result['seconds']
+
+
+#benchmarks present in both runs with their speed change, the ones slower by more than the tolerance are regressions
+def compare_to_baseline(results, baseline, tolerance=TOLERANCE):
+    comparison = []
+    for name, result in results.items():
+        if name in baseline:
+            change = get_speed(result)/get_speed(baseline[name]) - 1
+            comparison.append({'name': name, 'change': change, 'regression': change < -tolerance})
+    return comparison
+
+
+def load_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)['results']
+
+
+def save_results(results, path):
+    with open(path + '.tmp', 'w') as results_file:
+        json.dump({'created': time.time(), 'results': results}, results_file, indent=1)
+        results_file.write('\n')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation engine and the threshold solvers")
+    parser.add_argument('--quick', action='store_true', help="sizes " + str(QUICK_SIZES) + " and bank counts " + str(QUICK_BANK_COUNTS) + " only")
+    parser.add_argument('--sizes', type=int, nargs='+')
+    parser.add_argument('--banks', type=int, nargs='+')
+    parser.add_argument('--policies', nargs='+', choices=list(POLICIES), default=list(POLICIES))
+    parser.add_argument('--steps', type=int, default=STEPS)
+    parser.add_argument('--max-seconds', type=float, default=MAX_SECONDS)
+    parser.add_argument('--no-micro', action='store_true', help="skip the solver benchmarks")
+    parser.add_argument('--baseline', help="results file of the same machine to compare against")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--save', help="write the results to this file, e.g. as the next baseline")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    bank_counts = args.banks or (QUICK_BANK_COUNTS if args.quick else BANK_COUNTS)
+    results = run_benchmarks(get_cases(sizes, bank_counts, args.policies), args.steps, args.max_seconds, not args.no_micro)
+    if args.save:
+        save_results(results, args.save)
+
+    if args.baseline is None:
+        return 0
+    if not os.path.exists(args.baseline):
+        print("Warning: baseline " + args.baseline + " not found, the results are not compared", file=sys.stderr)
+        return 0
+    regressions = []
+    print()
+    for row in compare_to_baseline(results, load_results(args.baseline), args.tolerance):
+        print('%-62s %+8.1f %%%s' % (row['name'], 100*row['change'], '  REGRESSION' if row['regression'] else ''))
+        if row['regression']:
+            regressions.append(row['name'])
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
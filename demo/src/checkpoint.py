@@ -0,0 +1,73 @@
+import importlib
+import json
+import os
+
+import numpy as np
+
+#format of the checkpoint blob, loading refuses other versions
+CHECKPOINT_VERSION = 2
+
+
+#state of a simulation between two steps as one compressed numpy archive:
+#population arrays of every group, interest rates of every bank, market step, random stream seed and the curves so far
+def save_checkpoint(simulation, path):
+    market = simulation.market
+    curves = simulation.group_mean_score_change_curve
+    if curves is None:
+        curves = simulation.init_curves()
+    engine = type(simulation)
+    meta = {'version': CHECKPOINT_VERSION, 'engine': engine.__module__ + ':' + engine.__qualname__, 'scenario': simulation.scenario,
+            'step': market.step, 'entropy': simulation.seed_sequence.entropy, 'spawn_key': list(simulation.seed_sequence.spawn_key),
+            'interest_rate_ranges': [[float(rate) for rate in bank.interest_rate_range] for bank in simulation.banks]}
+
+    arrays = {'meta': np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)}
+    for i, group in enumerate(simulation.groups):
+        for key, value in group.get_state().items():
+            arrays['group_' + str(i) + '_' + key] = value
+        arrays['loans_' + str(i)] = np.array(market.loans[group.name])
+        arrays['utility_' + str(i)] = np.array(market.utility[group.name], dtype=float)
+        arrays['mean_score_change_' + str(i)] = np.array(curves[group.name], dtype=float)
+    for k, bank in enumerate(simulation.banks):
+        arrays['bank_' + str(k) + '_score_interest_rates'] = bank.score_interest_rates
+        arrays['max_irates_' + str(k)] = np.array(market.max_irates[bank.name], dtype=float)
+        arrays['min_irates_' + str(k)] = np.array(market.min_irates[bank.name], dtype=float)
+        for i, group in enumerate(simulation.groups):
+            arrays['N_loans_' + str(k) + '_' + str(i)] = np.array(bank.N_loan_curves[group.name])
+            arrays['total_utility_' + str(k) + '_' + str(i)] = np.array(bank.total_utility_curves[group.name], dtype=float)
+
+    #written under a temporary name first, an interrupted save keeps the previous checkpoint
+    with open(path + '.tmp', 'wb') as checkpoint_file:
+        np.savez_compressed(checkpoint_file, **arrays)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+#simulation restored from a checkpoint, run_oligopoly continues from the saved step with the same random streams
+def load_checkpoint(path, verbose=False):
+    with np.load(path) as checkpoint:
+        meta = json.loads(checkpoint['meta'].tobytes())
+        if meta['version'] != CHECKPOINT_VERSION:
+            raise ValueError("Unsupported checkpoint version " + str(meta['version']))
+        module_name, engine_name = meta['engine'].split(':')
+        engine = getattr(importlib.import_module(module_name), engine_name)
+        simulation = engine(scenario=meta['scenario'], verbose=verbose)
+        simulation.seed_sequence = np.random.SeedSequence(meta['entropy'], spawn_key=meta['spawn_key'])
+
+        market = simulation.market
+        market.step = meta['step']
+        curves = simulation.init_curves()
+        for i, group in enumerate(simulation.groups):
+            prefix = 'group_' + str(i) + '_'
+            group.set_state({name[len(prefix):]: checkpoint[name] for name in checkpoint.files if name.startswith(prefix)})
+            market.loans[group.name] = checkpoint['loans_' + str(i)].tolist()
+            market.utility[group.name] = checkpoint['utility_' + str(i)].tolist()
+            curves[group.name] = checkpoint['mean_score_change_' + str(i)].tolist()
+        for k, bank in enumerate(simulation.banks):
+            bank.interest_rate_range = meta['interest_rate_ranges'][k]
+            bank.score_interest_rates[:] = checkpoint['bank_' + str(k) + '_score_interest_rates']
+            market.max_irates[bank.name] = checkpoint['max_irates_' + str(k)].tolist()
+            market.min_irates[bank.name] = checkpoint['min_irates_' + str(k)].tolist()
+            for i, group in enumerate(simulation.groups):
+                bank.N_loan_curves[group.name] = checkpoint['N_loans_' + str(k) + '_' + str(i)].tolist()
+                bank.total_utility_curves[group.name] = checkpoint['total_utility_' + str(k) + '_' + str(i)].tolist()
+    return simulation
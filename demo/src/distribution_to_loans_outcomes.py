@@ -1,7 +1,11 @@
-"""Compute and Visualize outcome curves"""
+"""Compute and Visualize outcome curves
+
+Curves are computed on a (groups x scores) grid for any number of groups. Repay probabilities can be
+given as functions of the score or as arrays over the scores, see get_rhos.
+"""
 
 import numpy as np
-import solve_credit as sc
+import demo.src.solve_credit as sc
 
 
 def get_thresholds(loan_repaid_probs, pis, group_size_ratio, utils, score_change_fns, scores):
@@ -11,8 +15,8 @@ def get_thresholds(loan_repaid_probs, pis, group_size_ratio, utils, score_change
     break_even_prob = utility_default / (utility_default - utility_repaid)
 
     # getting loan policies
-    data = sc.fairness_data(get_rhos(loan_repaid_probs, scores), pis,
-                            group_size_ratio, break_even_prob)
+    rhos = get_rhos(loan_repaid_probs, scores)
+    data = sc.fairness_data(rhos, pis, group_size_ratio, break_even_prob)
     tau_maxprof = data.max_profit_loans()
     tau_dempar = data.demographic_loans()
     tau_eqopp = data.equal_opp_loans()
@@ -21,131 +25,135 @@ def get_thresholds(loan_repaid_probs, pis, group_size_ratio, utils, score_change
     thresh_dempar = get_thresholds_from_taus(tau_dempar, scores)
     thresh_eqopp = get_thresholds_from_taus(tau_eqopp, scores)
 
-    # unpacking repay probability as a function of score
-    loan_repay_fns = [lambda x: loan_repaid_prob(x) for
-                      loan_repaid_prob in loan_repaid_probs]
     # getting threshold at which average score change becomes negative
-    thresh_downwards = [get_mean_movement_threshold(pis[0], scores, loan_repay_fn,
-                                                    score_change_fns) for loan_repay_fn
-                        in loan_repay_fns]
+    thresh_downwards = list(get_mean_movement_thresholds(pis, scores, rhos, score_change_fns))
 
     return thresh_dempar, thresh_eqopp, thresh_maxprof, thresh_downwards
 
 
+def get_frontier(loan_repaid_probs, pis, group_size_ratio, utility_repaid, utility_default, score_change_fns, scores):
+    """profit and mean score change of every group under all 3 fairness criteria for every pair of bank utilities,
+    utility_repaid and utility_default are scalars or arrays (e.g. of Bank settings), see fairness_data.frontier"""
+    rhos = get_rhos(loan_repaid_probs, scores)
+    break_evens = sc.utilities_to_break_even(*np.broadcast_arrays(utility_repaid, utility_default))
+    data = sc.fairness_data(rhos, pis, group_size_ratio, None)
+    return data.frontier(break_evens, get_expected_moves(rhos, scores, move_vec=score_change_fns))
+
+
 def get_outcome_curve(loan_repay_fn, pi, scores, impacts):
     """compute the outcome curve"""
-    delta_mu = np.zeros(scores.size)
-    delta_mu[0] = exp_move(scores[-1], loan_repay_fn, bounds=[300, 850],
-                           move_vec=impacts) * pi[-1]
-    for i in range(1, scores.size):
-        delta_mu[i] = exp_move(scores[-(i + 1)], loan_repay_fn, bounds=[300, 850],
-                               move_vec=impacts) * pi[-(i + 1)] + delta_mu[i - 1]
+    return get_outcome_curves(get_rhos([loan_repay_fn], scores), np.asarray(pi)[None, :], scores, impacts)[0]
 
-    return delta_mu
+
+def get_outcome_curves(rhos, pis, scores, impacts):
+    """compute the outcome curve of every group, rows=groups"""
+    moves = get_expected_moves(rhos, scores, bounds=[300, 850], move_vec=impacts)
+    return get_cumulative_curves(moves, pis)
 
 
 def get_utility_curve(loan_repay_fns, pis, scores, utils):
     """compute the institution's utility curve"""
-    util = np.zeros([2, scores.size])
-    for j in range(2):
-        util[j, 0] = bank_util(scores[-1], loan_repay_fns[j], utils=utils) * pis[j, -1]
-        for i in range(1, scores.size):
-            util[j, i] = bank_util(scores[-(i + 1)], loan_repay_fns[j], utils=utils) * \
-                         pis[j, -(i + 1)] + util[j, i - 1]
-    return util
+    rhos = get_rhos(loan_repay_fns, scores)
+    return get_cumulative_curves(get_bank_utils(rhos, utils), pis)
 
 #### new
 def get_utility_interest_curve(loan_repay_fns, pis, scores, utils):
     """compute the institution's utility curve"""
-    util = np.zeros([2, scores.size])
-    for j in range(2):
-        util[j, 0] = bank_util_interest(scores[-1], loan_repay_fns[j], utils=utils) * pis[j, -1]
-        for i in range(1, scores.size):
-            util[j, i] = bank_util_interest(scores[-(i + 1)], loan_repay_fns[j], utils=utils) * \
-                         pis[j, -(i + 1)] + util[j, i - 1]
-    return util
+    rhos = get_rhos(loan_repay_fns, scores)
+    return get_cumulative_curves(get_bank_utils(rhos, utils, (1000 - np.asarray(scores, dtype=float)) / 1000), pis)
 
 #### new
 def get_utility_interest_curve_range(loan_repay_fns, pis, scores, score_range, interest_range, utils):
     """compute the institution's utility curve"""
     #interest_range[0] = max interest, interest_range[1] = min interest
-    
-    util = np.zeros([2, scores.size])
-    for j in range(2):
-        util[j, 0] = bank_util_interest_range(scores[-1], loan_repay_fns[j], score_range, interest_range, utils=utils) * pis[j, -1]
-        for i in range(1, scores.size):
-            util[j, i] = bank_util_interest_range(scores[-(i + 1)], loan_repay_fns[j], score_range, interest_range, utils=utils) * \
-                         pis[j, -(i + 1)] + util[j, i - 1]
-    return util
+    rhos = get_rhos(loan_repay_fns, scores)
+    return get_cumulative_curves(get_bank_utils(rhos, utils, np.interp(scores, score_range, interest_range)), pis)
 
 
-def get_utility_curves_dempar(util, cdfs, group_size_ratio, scores):
-    """compute the institution's utility curve under demographic parity constraint"""
-    util_total = np.zeros([2, scores.size])
-    cdfs[0] = list(reversed(1 - cdfs[0]))
-    cdfs[1] = list(reversed(1 - cdfs[1]))
+def get_cumulative_curves(values, pis):
+    """running sum of values * pis from the highest score down, rows=groups"""
+    return np.cumsum((values * pis)[:, ::-1], axis=1)
 
-    for i_a in range(scores.size):
-        prop_a = cdfs[0, i_a]
-        i_b = find_nearest(cdfs[1], prop_a)
-        util_total[0, i_a] = group_size_ratio[0] * util[0, i_a] + group_size_ratio[1] * util[1, i_b]
 
-    for i_b in range(scores.size):
-        prop_b = cdfs[1, i_b]
-        i_a = find_nearest(cdfs[0], prop_b)
-        util_total[1, i_b] = group_size_ratio[0] * util[0, i_a] + group_size_ratio[1] * util[1, i_b]
+def get_utility_curves_dempar(util, cdfs, group_size_ratio, scores):
+    """compute the institution's utility curve under demographic parity constraint,
+    every group is matched to the nearest selected share of each other group (the cdfs are flipped in place)"""
+    n_groups = len(util)
+    util_total = np.zeros([n_groups, scores.size])
+    for group in range(n_groups):
+        cdfs[group] = (1 - cdfs[group])[::-1]
+
+    for group in range(n_groups):
+        for other in range(n_groups):
+            if other == group:
+                matched = np.arange(scores.size)
+            else:
+                matched = find_nearest_sorted(cdfs[other], cdfs[group])
+            util_total[group] += group_size_ratio[other] * util[other, matched]
 
     return util_total
 
 
 def get_utility_curves_eqopp(util, loan_repaid_probs, pis, group_size_ratio, scores):
     """compute the institution's utility curve under equal opportunity constraint"""
-    rescaled_pis = np.zeros(pis.shape)
-    n_groups, n_scores = pis.shape
-    for group in range(n_groups):
-        for x in range(n_scores):
-            rescaled_pis[group, x] = pis[group, x] * loan_repaid_probs[group](scores[x])
-        print(rescaled_pis[group])
-        rescaled_pis[group] = rescaled_pis[group] / np.sum(rescaled_pis[group])
-        print(rescaled_pis[group])
-        print(np.sum(rescaled_pis[group]))
-    cdfs = np.zeros(pis.shape)
-    for group in range(n_groups):
-        cdfs[group, 0] = rescaled_pis[group, 0]
-        for x in range(1, n_scores):
-            cdfs[group, x] = rescaled_pis[group, x] + cdfs[group, x - 1]
+    rescaled_pis = pis * get_rhos(loan_repaid_probs, scores)
+    rescaled_pis = rescaled_pis / np.sum(rescaled_pis, axis=1, keepdims=True)
+    cdfs = np.cumsum(rescaled_pis, axis=1)
     return get_utility_curves_dempar(util, cdfs, group_size_ratio, scores)
 
 
 def get_rhos(loan_repaid_probs, scores):
-    """set up rhos[i,j] = probability of group i member repaying loan at state j"""
+    """set up rhos[i,j] = probability of group i member repaying loan at state j,
+    a function is called once with all scores if it returns one value per score, else once per score"""
     n_scores = len(scores)
     n_groups = len(loan_repaid_probs)
     rhos = np.zeros((n_groups, n_scores))
-    for j, s in enumerate(scores):
-        for i in range(n_groups):
-            rhos[i, j] = loan_repaid_probs[i](s)
+    for i in range(n_groups):
+        rhos[i] = evaluate_on_scores(loan_repaid_probs[i], scores)
     return rhos
 
 
+def evaluate_on_scores(f, scores):
+    """values of a function of the score (or of an array over the scores) on all scores"""
+    if not callable(f):
+        return np.broadcast_to(np.asarray(f, dtype=float), np.shape(scores))
+    try:
+        values = np.asarray(f(np.asarray(scores)), dtype=float)
+        if values.shape == np.shape(scores):
+            return values
+    # functions written for a single score may fail in any way on an array
+    except Exception:
+        pass
+    return np.array([f(s) for s in scores], dtype=float)
+
+
 def get_mean_movement_threshold(pi, scores, loan_repay_fn, score_change_fns, compare_pt=0.0):
     """randomized threshold below which group's mean score will decrease,
     above which it increases"""
-    running_sum = 0
-    for i, s in enumerate(reversed(scores)):
-        x = len(scores) - 1 - i
-        if ((running_sum + pi[x] * exp_move(s, loan_repay_fn, move_vec=score_change_fns))
-                < compare_pt):
-            randomized = (compare_pt - running_sum) / (exp_move(s, loan_repay_fn,
-                                                                move_vec=score_change_fns) * pi[x])
-            assert randomized >= 0
-            assert randomized <= 1
-            if i == 0:
-                return s
-            return s + randomized * abs(scores[x] - scores[x + 1])
-        else:
-            running_sum += pi[x] * exp_move(s, loan_repay_fn)
-    return s
+    rhos = get_rhos([loan_repay_fn], scores)
+    return get_mean_movement_thresholds(np.asarray(pi)[None, :], scores, rhos, score_change_fns, compare_pt)[0]
+
+
+def get_mean_movement_thresholds(pis, scores, rhos, score_change_fns, compare_pt=0.0):
+    """get_mean_movement_threshold of every group, rows of pis and rhos are groups;
+    as in the former loop the tested score moves by score_change_fns and the running sum by the default moves"""
+    scores = np.asarray(scores, dtype=float)
+    n_scores = scores.size
+    # from the highest score down, position i is score n_scores - 1 - i
+    tested = (pis * get_expected_moves(rhos, scores, move_vec=score_change_fns))[:, ::-1]
+    added = (pis * get_expected_moves(rhos, scores))[:, ::-1]
+    running_sums = np.column_stack((np.zeros(len(added)), np.cumsum(added, axis=1)[:, :-1]))
+
+    thresholds = np.full(len(rhos), scores[0])
+    below = running_sums + tested < compare_pt
+    for group in np.flatnonzero(below.any(axis=1)):
+        i = int(np.argmax(below[group]))
+        x = n_scores - 1 - i
+        randomized = (compare_pt - running_sums[group, i]) / tested[group, i]
+        assert randomized >= 0
+        assert randomized <= 1
+        thresholds[group] = scores[x] if i == 0 else scores[x] + randomized * abs(scores[x] - scores[x + 1])
+    return thresholds
 
 
 def exp_move(x, loan_repay_fn, bounds=[300, 850], move_vec=[-150, 75]):
@@ -158,6 +166,13 @@ def exp_move(x, loan_repay_fn, bounds=[300, 850], move_vec=[-150, 75]):
     return move_within_bounds
 
 
+def get_expected_moves(rhos, scores, bounds=[300, 850], move_vec=[-150, 75]):
+    """exp_move of every group (rows) and score (columns) from the repay probabilities"""
+    scores = np.asarray(scores, dtype=float)
+    move = (1 - rhos) * move_vec[0] + rhos * move_vec[1]
+    return np.maximum(np.minimum(scores + move, bounds[1]), bounds[0]) - scores
+
+
 def bank_util(x, loan_repay_fn, utils):
     """bank's expected utility"""
     util_repay = utils[1]
@@ -169,7 +184,7 @@ def bank_util_interest(x, loan_repay_fn, utils):
     """bank's expected utility"""
     util_repay = utils[1]
     util_def = utils[0]
-    #print("score: " + str(x) + " and interest: " + str(util_repay+(1000-x)/1000))  
+    #print("score: " + str(x) + " and interest: " + str(util_repay+(1000-x)/1000))
     return (1 - loan_repay_fn(x)) * util_def + loan_repay_fn(x) * (util_repay+(1000-x)/1000)
 
 ##### new
@@ -177,22 +192,34 @@ def bank_util_interest_range(x, loan_repay_fn, score_range, interest_range, util
     """bank's expected utility"""
     util_repay = utils[1]
     util_def = utils[0]
-    #print("score: " + str(x) + " and interest: " + str(util_repay + np.interp(x, score_range, interest_range)))  
+    #print("score: " + str(x) + " and interest: " + str(util_repay + np.interp(x, score_range, interest_range)))
     return (1 - loan_repay_fn(x)) * util_def + loan_repay_fn(x) * (util_repay+np.interp(x, score_range, interest_range))
 
 
+def get_bank_utils(rhos, utils, interest=0):
+    """bank_util of every group (rows) and score (columns) from the repay probabilities, interest is added to a repaid loan"""
+    return (1 - rhos) * utils[0] + rhos * (utils[1] + interest)
+
+
 def get_thresholds_from_taus(taus, scores):
     """Turn loaning policies into thresholds for visualization"""
-    thresholds = []
-    for tau in taus:
-        x = np.amin(np.where(tau > 0))
-        # to visualize the randomization
-        thresholds.append(
-            scores[x] + (1 - tau[x]) * np.abs(scores[x + 1] - scores[x]))
-    return thresholds
+    taus = np.asarray(taus)
+    scores = np.asarray(scores)
+    x = np.argmax(taus > 0, axis=1)
+    # to visualize the randomization
+    thresholds = scores[x] + (1 - taus[np.arange(len(taus)), x]) * np.abs(scores[x + 1] - scores[x])
+    return list(thresholds)
 
 
 def find_nearest(array, value):
     """find closest value"""
     idx = (np.abs(array - value)).argmin()
     return int(np.amin(idx))
+
+
+def find_nearest_sorted(array, values):
+    """find_nearest in an ascending array for many values at once, the first of equally close entries like argmin"""
+    right = np.minimum(np.searchsorted(array, values), len(array) - 1)
+    left = np.maximum(right - 1, 0)
+    nearest = np.where(np.abs(array[left] - values) <= np.abs(array[right] - values), left, right)
+    return np.searchsorted(array, array[nearest])
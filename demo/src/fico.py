@@ -1,8 +1,9 @@
 """Reading FICO Data"""
 
 from __future__ import print_function
+import hashlib
+import os
 import numpy as np
-import pandas as pd
 
 DATA_DIR = '../'
 
@@ -25,6 +26,7 @@ def cleanup_frame(frame):
 
 def read_totals(data_dir=DATA_DIR):
     """Read the total number of people of each race"""
+    import pandas as pd
     frame = cleanup_frame(pd.read_csv(data_dir + FILES['overview']))
     out = {}
     for f in frame:
@@ -60,6 +62,7 @@ def convert_percentiles(idx):
 
 def parse_data(data_dir=DATA_DIR, filenames=None):
     """Parse sqf data set."""
+    import pandas as pd
     if filenames is None:
         filenames = [FILES['cdf_by_race'], FILES['performance_by_race']]
 
@@ -80,3 +83,123 @@ def get_FICO_data(data_dir=DATA_DIR, do_convert_percentiles=True):
     cdfs = data_pair[0]
     performance = data_pair[1]
     return cdfs, performance, totals
+
+
+CACHE_FILE = '.fico_cache.npz'
+CACHE_VERSION = 1
+#score range whose repay probability tables are precomputed in the binary cache
+DEFAULT_SCORE_RANGE = (300, 850)
+
+_loaded = {}
+
+
+class FICO_data(object):
+    """FICO data as numpy arrays, scores are converted percentiles and columns follow `groups`"""
+
+    def __init__(self, groups, cdf_scores, cdfs, performance_scores, performance, totals, repay_prob_mappings=None):
+        self.groups = list(groups)
+        self.cdf_scores = cdf_scores
+        self.cdfs = cdfs
+        self.performance_scores = performance_scores
+        self.performance = performance
+        self.totals = dict(zip(self.groups, totals))
+        self.repay_prob_mappings = repay_prob_mappings if repay_prob_mappings is not None else {}
+        for array in (cdf_scores, cdfs, performance_scores, performance):
+            array.setflags(write=False)
+
+    def get_cdfs(self, group_names):
+        """CDF of every given group over `cdf_scores`, one row per group"""
+        return self.cdfs[:, [self.groups.index(name) for name in group_names]].T
+
+    def get_totals(self):
+        """Copy of the total number of people of each race"""
+        return dict(self.totals)
+
+    def get_repay_prob_mapping(self, group_name, score_range):
+        """Repay probability of every integer score of the score range (index 0 = lowest score), read only and shared"""
+        key = (group_name, int(score_range[0]), int(score_range[1]))
+        if key not in self.repay_prob_mappings:
+            x_axis = np.linspace(score_range[0], score_range[1], score_range[1]-score_range[0]+1, dtype=int)
+            mapping = np.interp(x_axis, self.performance_scores, self.performance[:, self.groups.index(group_name)])
+            mapping.setflags(write=False)
+            self.repay_prob_mappings[key] = mapping
+        return self.repay_prob_mappings[key]
+
+
+def get_file_stamps(data_dir):
+    """(mtime, size) of every data file, cheap check of the binary cache"""
+    stats = [os.stat(data_dir + name) for name in FILES.values()]
+    return np.array([[stat.st_mtime_ns, stat.st_size] for stat in stats], dtype=np.int64)
+
+
+def get_file_hashes(data_dir):
+    """SHA-1 of every data file, used when the stamps changed but the content may not have"""
+    hashes = []
+    for name in FILES.values():
+        with open(data_dir + name, 'rb') as data_file:
+            hashes.append(hashlib.sha1(data_file.read()).hexdigest())
+    return np.array(hashes)
+
+
+def compile_FICO_data(data_dir=DATA_DIR):
+    """Parse the CSV files once into FICO_data with the repay probability tables of the default score range"""
+    cdfs, performance, totals = get_FICO_data(data_dir)
+    data = FICO_data(cdfs.columns, cdfs.index.values.astype(float), cdfs.values.astype(float),
+                     performance.index.values.astype(float), performance.values.astype(float),
+                     [totals[group] for group in cdfs.columns])
+    for group in data.groups:
+        data.get_repay_prob_mapping(group, DEFAULT_SCORE_RANGE)
+    return data
+
+
+def save_FICO_cache(data, path, stamps, hashes):
+    """Write FICO_data as one numpy archive with the stamps and hashes of its source files"""
+    mapped_groups = [key[0] for key in data.repay_prob_mappings if key[1:] == DEFAULT_SCORE_RANGE]
+    np.savez(path, version=CACHE_VERSION, stamps=stamps, hashes=hashes, groups=np.array(data.groups),
+             cdf_scores=data.cdf_scores, cdfs=data.cdfs, performance_scores=data.performance_scores, performance=data.performance,
+             totals=np.array([data.totals[group] for group in data.groups], dtype=float),
+             mapped_groups=np.array(mapped_groups),
+             repay_prob_mappings=np.array([data.repay_prob_mappings[(group,) + DEFAULT_SCORE_RANGE] for group in mapped_groups]))
+
+
+def read_FICO_cache(path, stamps, data_dir):
+    """FICO_data of the binary cache, None if there is none or its source files changed"""
+    try:
+        cache = np.load(path)
+    except (OSError, ValueError):
+        return None
+    with cache:
+        if int(cache['version']) != CACHE_VERSION:
+            return None
+        if not np.array_equal(cache['stamps'], stamps) and not np.array_equal(cache['hashes'], get_file_hashes(data_dir)):
+            return None
+        mappings = {(str(group),) + DEFAULT_SCORE_RANGE: mapping for group, mapping in zip(cache['mapped_groups'], cache['repay_prob_mappings'])}
+        for mapping in mappings.values():
+            mapping.setflags(write=False)
+        return FICO_data([str(group) for group in cache['groups']], cache['cdf_scores'], cache['cdfs'],
+                         cache['performance_scores'], cache['performance'], [float(total) for total in cache['totals']], mappings)
+
+
+def load_FICO_data(data_dir=DATA_DIR):
+    """FICO_data memoized in the process and compiled to a binary cache next to the CSV files
+
+    The cache is rebuilt when the files changed (mtime and size, then SHA-1 of the content).
+    If the data directory is not writable the compiled data is only kept in the process.
+    """
+    stamps = get_file_stamps(data_dir)
+    key = os.path.abspath(data_dir)
+    if key in _loaded and np.array_equal(_loaded[key][0], stamps):
+        return _loaded[key][1]
+
+    path = data_dir + CACHE_FILE
+    data = read_FICO_cache(path, stamps, data_dir)
+    if data is None:
+        data = compile_FICO_data(data_dir)
+        try:
+            with open(path + '.tmp', 'wb') as cache_file:
+                save_FICO_cache(data, cache_file, stamps, get_file_hashes(data_dir))
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+    _loaded[key] = (stamps, data)
+    return data
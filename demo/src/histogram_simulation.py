@@ -0,0 +1,155 @@
+import numpy as np
+
+from demo.src.applicant_group import Applicant_group
+from demo.src.simulation import Simulation, INIT_STREAM
+
+
+#Applicant group kept as numbers of applicants in every (score, real score) state instead of individual applicants
+#counts[i, j] = applicants with score score_range[0]+i and initial real score score_range[0]+j
+#like the repay probabilities of Applicant_group, the real score index stays at the initial real score
+class Histogram_group(Applicant_group):
+    def __init__(self, name, color, line_style, size, scores, loan_demand, error_rate, score_error, market, repays, ir_limit=np.inf, rng=None):
+        self.score_axis = np.arange(market.score_range[0], market.score_range[1]+1)
+        super().__init__(name, color, line_style, size, scores, loan_demand, error_rate, score_error, market, repays, ir_limit, rng)
+
+    #the state counts take the place of the population arrays
+    def create_applicants(self, scores, state_counts, ir_limit):
+        self.counts = state_counts
+        self.ir_limit = ir_limit
+        return self.size
+
+    def sort_by_score(self):
+        return self.counts
+
+    #simulating that some members of the group have better score/repay prob than rated, returns the state counts
+    def set_real_scores(self, scores, error_rate, score_error, market):
+        n_scores = self.score_axis.size
+        score_counts = np.bincount(np.asarray(scores[:self.size], dtype=np.intp) - market.score_range[0], minlength=n_scores)
+        better_counts = self.rng.multivariate_hypergeometric(score_counts, int(self.size*error_rate))
+        state_counts = np.zeros((n_scores, n_scores), dtype=np.int64)
+        state_counts[np.arange(n_scores), np.arange(n_scores)] = score_counts - better_counts
+        np.add.at(state_counts, (np.arange(n_scores), np.clip(np.arange(n_scores) + score_error, 0, n_scores-1)), better_counts)
+        return state_counts
+
+    def get_state(self):
+        return {'counts': self.counts, 'ir_limit': np.array(self.ir_limit), 'initial_mean_score': np.array(self.initial_mean_score)}
+
+    def set_state(self, state):
+        self.counts = np.array(state['counts'], dtype=np.int64)
+        self.ir_limit = float(state['ir_limit'])
+        self.size = int(self.counts.sum())
+        self.initial_mean_score = float(state['initial_mean_score'])
+        return self.size
+
+    def get_score_histogram(self):
+        return self.score_axis, self.counts.sum(axis=1)
+
+    #individual scores in descending order, only meant for plotting
+    def get_scores(self):
+        return np.repeat(self.score_axis[::-1], self.counts.sum(axis=1)[::-1])
+
+    #scores in descending order and the number of applicants behind each of them, one entry per occupied score
+    def get_score_entries(self):
+        score_counts = self.counts.sum(axis=1)[::-1]
+        scores = self.score_axis[::-1][score_counts > 0]
+        counts = score_counts[score_counts > 0].astype(float)
+        #the first applicant is an entry of its own, so the curve has the same maxima as the one of individual applicants
+        scores = np.concatenate((scores[:1], scores))
+        counts = np.concatenate(([1], counts))
+        counts[1] -= 1
+        return scores, counts
+
+    def get_mean_score_change(self):
+        return np.dot(self.counts.sum(axis=1), self.score_axis)/self.size - self.initial_mean_score
+
+    #gives loans to a random part of the group according to its loan demand, every applicant takes the cheapest offer under the interest rate limit
+    #returns number of applicants, loans and utility per bank
+    def allocate_loans(self, market, banks):
+        n_scores = self.score_axis.size
+        score_counts = self.counts.sum(axis=1)
+        #every score covers the positions [starts, ends) of the descending order
+        ends = np.cumsum(score_counts[::-1])[::-1]
+        starts = ends - score_counts
+
+        #number of top positions offered a loan by every bank, segment m is offered loans by banks bank_order[:m+1]
+        selection_rates = np.array([bank.group_selection_rate[self.name] for bank in banks], dtype=float)
+        prefixes = np.minimum(np.floor(selection_rates*self.size + 1e-6) + 1, self.size)
+        bank_order = np.argsort(-prefixes, kind='stable')
+        segment_ends = prefixes[bank_order]
+        segment_starts = np.append(segment_ends[1:], 0)
+        overlaps = np.clip(np.minimum(ends[:, None], segment_ends) - np.maximum(starts[:, None], segment_starts), 0, None).astype(np.int64)
+
+        #cheapest bank for every score and segment, -1 = no offer under the interest rate limit
+        score_shifts = np.array([bank.score_shift for bank in banks], dtype=np.int32)
+        interest_rates = np.array([bank.score_interest_rates for bank in banks])
+        expected_scores = np.clip(self.score_axis[None, :] + score_shifts[:, None], self.score_range[0], self.score_range[1])
+        offered_rates = np.take_along_axis(interest_rates, expected_scores - self.score_range[0], axis=1)
+        offered_rates = np.where(offered_rates < self.ir_limit, offered_rates, np.inf)
+        lenders = np.full((n_scores, len(banks)), -1)
+        offering = np.zeros((len(banks), 1), dtype=bool)
+        for m in range(len(banks)):
+            offering[bank_order[m]] = True
+            rates = np.where(offering, offered_rates, np.inf)
+            lenders[:, m] = np.where(np.isfinite(np.min(rates, axis=0)), np.argmin(rates, axis=0), -1)
+
+        #draw applicants from the occupied states
+        score_index, real_score_index = np.nonzero(self.counts)
+        N_applicants = int(self.size*self.loan_demand)
+        applicants = self.rng.multivariate_hypergeometric(self.counts[score_index, real_score_index], N_applicants)
+        segment_applicants = self.spread_over_segments(score_index, applicants, overlaps, score_counts)
+
+        #repay outcomes and score changes of all loans
+        state_lenders = lenders[score_index]
+        loans = np.where(state_lenders >= 0, segment_applicants, 0)
+        with market.profile.phase('score_update'):
+            repaid = self.rng.binomial(loans, self.score_repay_prob[real_score_index, None])
+            defaulted = loans - repaid
+            repaid_score_index = np.clip(score_index + market.repay_score, 0, n_scores-1)
+            self.counts[score_index, real_score_index] -= loans.sum(axis=1)
+            np.add.at(self.counts, (repaid_score_index, real_score_index), repaid.sum(axis=1))
+            np.add.at(self.counts, (np.clip(score_index + market.default_score, 0, n_scores-1), real_score_index), defaulted.sum(axis=1))
+
+        #bank utility uses the interest rate of the borrower's score after the outcome
+        utility_default = np.array([bank.utility_default for bank in banks], dtype=float)
+        utility_repaid = np.array([bank.utility_repaid for bank in banks], dtype=float)
+        offers = state_lenders >= 0
+        loan_rates = interest_rates[state_lenders[offers], np.broadcast_to(repaid_score_index[:, None], offers.shape)[offers]]
+        loan_utilities = repaid[offers]*(utility_repaid[state_lenders[offers]] + loan_rates) + defaulted[offers]*utility_default[state_lenders[offers]]
+        group_loans = np.bincount(state_lenders[offers], weights=loans[offers], minlength=len(banks)).astype(int)
+        group_utilities = np.bincount(state_lenders[offers], weights=loan_utilities, minlength=len(banks))
+        return N_applicants, group_loans, group_utilities
+
+    #applicants of every state spread over the segments of its score, rows=states, columns=segments
+    #the positions of a score are taken at random without replacement, so no segment gets more applicants than it has positions
+    #only the few scores at segment boundaries are split, the others lie in a single segment or in the part without offers
+    def spread_over_segments(self, score_index, applicants, overlaps, score_counts):
+        capacities = np.column_stack((overlaps, score_counts - overlaps.sum(axis=1)))
+        segment_applicants = np.zeros((score_index.size, capacities.shape[1]), dtype=np.int64)
+        single = np.count_nonzero(capacities, axis=1) == 1
+        inside = single[score_index]
+        segment_applicants[inside, np.argmax(capacities > 0, axis=1)[score_index[inside]]] = applicants[inside]
+        for i in np.flatnonzero(~single & (score_counts > 0)):
+            states = np.flatnonzero(score_index == i)
+            remaining = applicants[states]
+            segment_counts = self.rng.multivariate_hypergeometric(capacities[i], int(remaining.sum()))
+            #positions of the score hold its states in random order, so every segment draws from the applicants left
+            for m in np.flatnonzero(segment_counts):
+                segment_applicants[states, m] = self.rng.multivariate_hypergeometric(remaining, int(segment_counts[m]))
+                remaining = remaining - segment_applicants[states, m]
+        return segment_applicants[:, :-1]
+
+
+#Simulation evolving state counts of every group instead of individual applicants, per step cost depends on the score range only
+#all policies select on the score counts, see Market.get_selection_rate
+class Histogram_simulation(Simulation):
+    def create_group(self, group_setting, size, scores, repays):
+        return Histogram_group(name=group_setting['name'], color=group_setting['color'], line_style=group_setting['line_style'],
+                               size=size, scores=scores, loan_demand=group_setting['loan_demand'],
+                               error_rate=group_setting['error_rate'], score_error=group_setting['score_error'], market=self.market,
+                               repays=repays, ir_limit=group_setting['interest_rate_limit'], rng=self.get_rng(INIT_STREAM, len(self.groups)))
+
+    def give_loans(self, group):
+        N_applicants, group_loans, group_utilities = group.allocate_loans(self.market, self.banks)
+        #there are no individual loans, the utility curve of a step is its total
+        utility_curves = [group_utilities[k:k+1] for k in range(len(self.banks))]
+        return N_applicants, group_loans, group_utilities, utility_curves
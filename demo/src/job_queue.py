@@ -0,0 +1,181 @@
+import concurrent.futures
+import multiprocessing
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from demo.src.simulation import Simulation
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+#finished jobs kept per session for listing, older ones are forgotten
+MAX_FINISHED_JOBS = 20
+
+
+class Job_cancelled(Exception):
+    pass
+
+
+#plot data of a finished run, the same the index page shows
+def get_simulation_result(simulation, groups, group_mean_score_change_curve):
+    market = simulation.market
+    groups_plot = []
+    step_array = []
+    for group in groups:
+        n, bins = np.histogram(group.get_scores(), range=market.score_range)
+        step_array = list(range(len(group_mean_score_change_curve[group.name])))
+        groups_plot.append({'name': group.name, 'color': group.color, 'hist': n.tolist(), 'hist_labels': bins[1:].tolist(),
+                            'mean_score_change': [float(change) for change in group_mean_score_change_curve[group.name]]})
+    return {'groups_plot': groups_plot, 'step_array': step_array,
+            'loans': market.loans, 'utility': market.utility, 'max_irates': market.max_irates, 'min_irates': market.min_irates}
+
+
+#compact summary of the last step, streamed to the page while the run is in progress
+def get_step_summary(simulation, group_mean_score_change_curve):
+    market = simulation.market
+    return {'step': market.step,
+            'mean_score_change': {name: float(curve[-1]) for name, curve in group_mean_score_change_curve.items()},
+            'loans': {name: loans[-1] for name, loans in market.loans.items()},
+            'utility': {name: utility[-1] for name, utility in market.utility.items()},
+            'max_irates': {name: float(irates[-1]) for name, irates in market.max_irates.items()},
+            'min_irates': {name: float(irates[-1]) for name, irates in market.min_irates.items()}}
+
+
+#values of a step summary by series name, e.g. 'loans/White' or 'max_irates/reference bank'
+def get_step_series(summary):
+    return {curve + '/' + name: value for curve, values in summary.items() if curve != 'step' for name, value in values.items()}
+
+
+#worker of the process pool, progress, step summaries and cancellation are shared with the web process through manager objects
+#history gets the series of every step from step 0 on while the run is live (add_step) and is closed however the run ends
+def run_job(job_id, scenario, steps, seed, progress, summaries, cancelled, history=None):
+    def on_step(simulation, group_mean_score_change_curve):
+        if job_id in cancelled:
+            raise Job_cancelled(job_id)
+        summary = get_step_summary(simulation, group_mean_score_change_curve)
+        summaries.append(summary)
+        if history is not None:
+            history.add_step(summary['step'], get_step_series(summary))
+        progress[job_id] = simulation.market.step
+
+    progress[job_id] = 0
+    try:
+        simulation = Simulation(scenario=scenario, seed=seed, verbose=False)
+        if history is not None:
+            history.add_step(0, get_step_series(get_step_summary(simulation, simulation.init_curves())))
+        banks, groups, group_mean_score_change_curve = simulation.run_oligopoly(steps, on_step=on_step)
+    finally:
+        if history is not None:
+            history.close()
+    return get_simulation_result(simulation, groups, group_mean_score_change_curve)
+
+
+class Job:
+    def __init__(self, job_id, session_id, steps, future, summaries):
+        self.job_id = job_id
+        self.session_id = session_id
+        self.steps = steps
+        self.future = future
+        self.summaries = summaries
+        self.submitted = time.time()
+
+
+#Simulation runs executed by a local process pool, so a long run does not hold a web worker
+#jobs live in the memory of the web process which submitted them, initializer is run by every worker process
+class Job_queue:
+    def __init__(self, processes=None, initializer=None):
+        self.executor = concurrent.futures.ProcessPoolExecutor(processes, initializer=initializer)
+        self.manager = multiprocessing.Manager()
+        self.progress = self.manager.dict()
+        self.cancelled = self.manager.dict()
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    #history(session_id, job_id) creates the per step history writer of the job, see run_job
+    def submit(self, session_id, scenario, steps, seed=None, history=None):
+        job_id = uuid.uuid4().hex
+        summaries = self.manager.list()
+        writer = history(session_id, job_id) if history is not None else None
+        future = self.executor.submit(run_job, job_id, scenario, steps, seed, self.progress, summaries, self.cancelled, writer)
+        with self.lock:
+            self.jobs[job_id] = Job(job_id, session_id, steps, future, summaries)
+            self.forget_finished(session_id)
+        return job_id
+
+    #None for an unknown job or a job of another session
+    def get_job(self, session_id, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or job.session_id != session_id:
+            return None
+        return job
+
+    def get_status(self, job):
+        future = job.future
+        if future.cancelled():
+            return CANCELLED
+        if not future.done():
+            return RUNNING if job.job_id in self.progress else QUEUED
+        error = future.exception()
+        if isinstance(error, Job_cancelled):
+            return CANCELLED
+        return DONE if error is None else FAILED
+
+    def get_info(self, job, with_result=False):
+        status = self.get_status(job)
+        info = {'id': job.job_id, 'status': status, 'steps': job.steps, 'steps_done': self.progress.get(job.job_id, 0),
+                'submitted': job.submitted}
+        if status == FAILED:
+            info['error'] = repr(job.future.exception())
+        if status == DONE and with_result:
+            info['steps_done'] = job.steps
+            info['result'] = job.future.result()
+        return info
+
+    #step summaries from the given position on, the list grows while the job runs
+    def get_summaries(self, job, start=0):
+        return job.summaries[start:]
+
+    def is_finished(self, job):
+        return self.get_status(job) not in (QUEUED, RUNNING)
+
+    def list_jobs(self, session_id):
+        with self.lock:
+            jobs = [job for job in self.jobs.values() if job.session_id == session_id]
+        return [self.get_info(job) for job in sorted(jobs, key=lambda job: job.submitted)]
+
+    #a queued job is dropped, a running job stops after its current step
+    def cancel(self, job):
+        if not job.future.cancel() and not job.future.done():
+            self.cancelled[job.job_id] = True
+        return self.get_status(job)
+
+    def forget_finished(self, session_id):
+        finished = sorted((job for job in self.jobs.values() if job.session_id == session_id and job.future.done()), key=lambda job: job.submitted)
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job.job_id]
+            self.progress.pop(job.job_id, None)
+            self.cancelled.pop(job.job_id, None)
+        return len(finished)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.manager.shutdown()
+
+
+job_queue = None
+job_queue_lock = threading.Lock()
+
+
+#process wide queue created on first use, so importing the module starts no processes
+def get_job_queue(processes=None, initializer=None):
+    global job_queue
+    with job_queue_lock:
+        if job_queue is None:
+            job_queue = Job_queue(processes, initializer)
+        return job_queue
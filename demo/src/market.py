@@ -1,5 +1,6 @@
 import numpy as np
-import matplotlib.pyplot as plt
+
+from demo.src.profiling import NO_PROFILE
 
 class Market:
     def __init__(self, policy, policy_color, score_range = [300,850], repay_score = 75, default_score = -150, max_interest_rate_range =[0.5, 0.5], min_interest_rate_range=[0.001,0.001], plane_range=[0, 1], plane_slice_step=0.01):
@@ -10,7 +11,9 @@ class Market:
         self.default_score = default_score
         self.max_interest_rate_range = max_interest_rate_range
         self.min_interest_rate_range = min_interest_rate_range
-        self.interest_rate_plane = self.set_interest_rate_plane(plane_range, plane_slice_step)
+        #nothing in a run reads the interest rate plane, set_interest_rate_plane(plane_range, plane_slice_step) builds it on demand
+        self.plane_range = plane_range
+        self.plane_slice_step = plane_slice_step
         self.step = 0
         
         self.max_irates = {}
@@ -18,18 +21,20 @@ class Market:
         #loans and util on the whole market
         self.loans = {}
         self.utility = {}
+        #phase timing and counters, set by the simulation when profiling is on
+        self.profile = NO_PROFILE
     
-    #create interest rate plane    
+    #create interest rate plane, rows=market share slices, columns=scores of the score range
     def set_interest_rate_plane(self, plane_range, plane_slice_step):
-        interest_rate_plane = {}
         plane_slices = np.arange(plane_range[0], plane_range[1] + plane_slice_step , plane_slice_step)
-        for pslice in plane_slices:
-            interest_rate_range = np.array(self.max_interest_rate_range) - (np.array(self.max_interest_rate_range) - np.array(self.min_interest_rate_range))*(pslice/(plane_range[1]-plane_range[0]))
-            x_axis = np.linspace(self.score_range[0], self.score_range[1], self.score_range[1]-self.score_range[0]+1, dtype=int)
-            y_axis = np.interp(x_axis, self.score_range, interest_rate_range)
-            interest_rate_plane[str(round(pslice,4))] = dict(zip(x_axis, np.around(y_axis,5)))
+        max_interest_rate_range = np.array(self.max_interest_rate_range, dtype=float)
+        min_interest_rate_range = np.array(self.min_interest_rate_range, dtype=float)
+        interest_rate_ranges = max_interest_rate_range - (max_interest_rate_range - min_interest_rate_range)*(plane_slices/(plane_range[1]-plane_range[0]))[:, None]
 
-        return interest_rate_plane
+        #linear interpolation between the rates of the lowest and the highest score for every slice
+        x_axis = np.linspace(0, 1, self.score_range[1]-self.score_range[0]+1)
+        interest_rate_plane = interest_rate_ranges[:, :1] + (interest_rate_ranges[:, 1:] - interest_rate_ranges[:, :1])*x_axis
+        return np.around(interest_rate_plane, 5)
     
     def get_selection_rate(self, banks, groups):
         if self.policy == "Max. utility":
@@ -41,133 +46,135 @@ class Market:
         else:
             return None
         
-    def get_MU_selection_rate(self, banks, groups):
-        #Get expected bank utility and set the bank selection rate
+    #expected utility of a single applicant of the group with each of the given scores, rows=banks
+    def get_expected_utilities(self, banks, group, scores):
+        score_shifts = np.array([bank.score_shift for bank in banks], dtype=np.int32)
+        utility_default = np.array([bank.utility_default for bank in banks], dtype=float)
+        utility_repaid = np.array([bank.utility_repaid for bank in banks], dtype=float)
+        interest_rates = np.array([bank.score_interest_rates for bank in banks])
+        repay_probs = group.score_repay_prob
+
+        #expected utility of a single applicant for every bank and every score
+        utility_table = utility_default[:, None]*(1-repay_probs) + (utility_repaid[:, None]+interest_rates)*repay_probs
+        expected_scores = np.clip(scores[None, :] + score_shifts[:, None], self.score_range[0], self.score_range[1])
+        utilities = np.take_along_axis(utility_table, expected_scores - self.score_range[0], axis=1)
+        self.profile.count('bank_evaluations', utilities.size)
+        return utilities
+
+    #expected utility curves of all banks for one group, rows=banks, columns=score entries of the group in descending score order
+    #returns the curves and the number of applicants selected up to the end of every entry
+    def get_expected_utility_curves(self, banks, group):
+        scores, counts = group.get_score_entries()
+        utilities = self.get_expected_utilities(banks, group, scores)
+        return np.cumsum(utilities*counts, axis=1), np.cumsum(counts)
+
+    #expected utility curves of all banks along a constraint shared by the groups, e.g. the share of applicants selected (DP)
+    #or the share of expected repayers selected (EO), every group is selected in descending score order up to the same value
+    #get_weights(group, scores) is what one applicant of each score adds to the constrained value of the group before normalizing
+    #the curves of a group are linear between two score changes, so their sum is exact on the grid of all group breakpoints
+    #returns the grid of constrained values, the curves (rows=banks) and the number of applicants selected per group at every grid value
+    def get_constrained_utility_curves(self, banks, groups, get_weights):
+        group_curves = []
+        for group in groups:
+            scores, counts = group.get_score_entries()
+            #applicants with the same score are one linear piece of the curves
+            ends = np.append(np.flatnonzero(scores[1:] != scores[:-1]), scores.size - 1)
+            scores = scores[ends]
+            counts = np.add.reduceat(counts, np.append(0, ends[:-1] + 1))
+            utilities = self.get_expected_utilities(banks, group, scores)
+            constrained = np.append(0, np.cumsum(counts*get_weights(group, scores)))
+            if constrained[-1] <= 0:
+                #no weight in the group (e.g. no expected repayers for equal opportunity), its zero curve selects nobody
+                group_curves.append((np.array([0., 1.]), np.zeros(2), np.zeros((len(banks), 2))))
+                continue
+            group_curves.append((constrained/constrained[-1], np.append(0, np.cumsum(counts)),
+                                 np.column_stack((np.zeros(len(banks)), np.cumsum(utilities*counts, axis=1)))))
+
+        grid = np.unique(np.concatenate([constrained for constrained, selected, curves in group_curves]))
+        utility_curves = np.zeros((len(banks), grid.size))
+        group_selected = []
+        for constrained, selected, curves in group_curves:
+            index = np.clip(np.searchsorted(constrained, grid), 1, constrained.size - 1)
+            steps = constrained[index] - constrained[index-1]
+            weights = np.clip(np.divide(grid - constrained[index-1], steps, out=np.ones(grid.size), where=steps > 0), 0, 1)
+            utility_curves += curves[:, index-1] + (curves[:, index] - curves[:, index-1])*weights
+            group_selected.append(selected[index-1] + (selected[index] - selected[index-1])*weights)
+        return grid, utility_curves, group_selected
+
+    #the last grid value with maximal expected utility for every bank, the expected utility curve of all groups is set for each of them
+    def get_constrained_selection_rate(self, banks, groups, get_weights):
         selection_rates = {}
         max_util = {}
-        for bank in banks:
-            selection_rates[bank.name] = {}
-            utility_curve = {}
-            tmp_max_util = 0
-            for group in groups:
-                utility = 0
-                utility_curve[group.name] = []
-                for applicant in group.applicants:
-                    applicant_score = bank.get_expected_applicant_score(self, applicant.score)
-                    utility += bank.get_applicant_evaluation_utility(applicant_score, group)
-                    utility_curve[group.name].append(utility)
-                
-                bank.set_expected_group_utility_curve(group, utility_curve[group.name])
-                #bank.plot_expected_group_utility_curve(group)
-                tmp_max_util += max(utility_curve[group.name])
-                selection_rates[bank.name][group.name] = (len(utility_curve[group.name]) - np.argmax(list(reversed(utility_curve[group.name])))-1)/group.size
-                #print('Selection rate of ' + bank.name + ' bank for ' + group.name + ' group: ' + str(selection_rates[bank.name][group.name]))                
-                
-            max_util[bank.name] = tmp_max_util
+        grid, utility_curves, group_selected = self.get_constrained_utility_curves(banks, groups, get_weights)
+        selected = grid.size - np.argmax(utility_curves[:, ::-1], axis=1) - 1
+        for i in range(len(banks)):
+            selection_rates[banks[i].name] = {}
+            max_util[banks[i].name] = utility_curves[i, selected[i]]
+            for j in range(len(groups)):
+                banks[i].set_expected_group_utility_curve(groups[j], utility_curves[i])
+                #rates select applicants up to position rate*size, see allocate_loans
+                selected_applicants = np.floor(group_selected[j][selected[i]] + 1e-9)
+                selection_rates[banks[i].name][groups[j].name] = max(selected_applicants - 1, 0)/groups[j].size
+                #print('Selection rate of ' + banks[i].name + ' bank for ' + groups[j].name + ' group: ' + str(selection_rates[banks[i].name][groups[j].name]))
 
-        
         return [selection_rates, max_util]
-    
-    
-    def get_DP_selection_rate(self, banks, groups):
-        #Get expected bank utility and set the bank selection rate
-        selection_rates = {}
 
-        max_util = {}
-        for bank in banks:
-            group_sizes = []
-            selection_rates[bank.name] = {}
-            utility_curve = {}
-            for group in groups:
-                utility = 0
-                utility_curve[group.name] = []
-                group_sizes.append(group.size)
-                for applicant in group.applicants:
-                    applicant_score = bank.get_expected_applicant_score(self, applicant.score)
-                    utility += bank.get_applicant_evaluation_utility(applicant_score, group)
-                    utility_curve[group.name].append(utility)
-                
-            merged_utility_curve = []
-            for group in groups:
-                if group.size != max(group_sizes):             
-                    x = list(range(0, group.size))
-                    x = np.array(x)*(max(group_sizes)/group.size)
-                    y = utility_curve[group.name]
-                    z = np.polyfit(x, y, 3)
-                    p = np.poly1d(z)
-                    if len(merged_utility_curve) == 0:
-                        merged_utility_curve = [0] * max(group_sizes)
-                    merged_utility_curve += p(list(range(0,max(group_sizes))))
-                else:
-                    merged_utility_curve += utility_curve[group.name]
-            
-            for group in groups:
-                bank.set_expected_group_utility_curve(group, merged_utility_curve)
-                #bank.plot_expected_group_utility_curve(group)
-                selection_rates[bank.name][group.name] = (len(merged_utility_curve) - np.argmax(list(reversed(merged_utility_curve)))-1)/max(group_sizes)
-                max_util[bank.name] = max(merged_utility_curve) 
-                #print('Selection rate of ' + bank.name + ' bank for ' + group.name + ' group: ' + str(selection_rates[bank.name][group.name]))
+    #give loans to the selected applicants of one group, every applicant takes the cheapest offer under their interest rate limit
+    #returns bank index, repay outcome(1=repaid, 0=default ) and bank utility of every given loan
+    def allocate_loans(self, banks, group, applicants):
+        score_shifts = np.array([bank.score_shift for bank in banks], dtype=np.int32)
+        selection_rates = np.array([bank.group_selection_rate[group.name] for bank in banks], dtype=float)
+        interest_rates = np.array([bank.score_interest_rates for bank in banks])
 
-        return [selection_rates, max_util]
+        #rates offered by every bank (rows) to every applicant (columns)
+        expected_scores = np.clip(group.scores[applicants][None, :] + score_shifts[:, None], self.score_range[0], self.score_range[1])
+        offered_rates = np.take_along_axis(interest_rates, expected_scores - self.score_range[0], axis=1)
+        offered = (applicants[None, :]/group.size <= selection_rates[:, None]) & (offered_rates < group.ir_limits[applicants][None, :])
+        offered_rates = np.where(offered, offered_rates, np.inf)
 
-    def get_EO_selection_rate(self, banks, groups):
+        borrowers = offered.any(axis=0)
+        lenders = np.argmin(offered_rates[:, borrowers], axis=0)
+        with self.profile.phase('score_update'):
+            outcomes = group.get_repay_outcomes(self, applicants[borrowers])
+
+        #bank utility uses the interest rate of the borrower's score after the outcome
+        utility_default = np.array([bank.utility_default for bank in banks], dtype=float)
+        utility_repaid = np.array([bank.utility_repaid for bank in banks], dtype=float)
+        loan_rates = interest_rates[lenders, group.scores[applicants[borrowers]] - self.score_range[0]]
+        utilities = np.where(outcomes, utility_repaid[lenders] + loan_rates, utility_default[lenders])
+        return lenders, outcomes, utilities
+
+    def get_MU_selection_rate(self, banks, groups):
         #Get expected bank utility and set the bank selection rate
         selection_rates = {}
         max_util = {}
         for bank in banks:
-            group_sizes = []
             selection_rates[bank.name] = {}
-            utility_curve = {}
-            TPRs = {}
-            for group in groups:
-                utility = 0
-                utility_curve[group.name] = []
-                TPRs[group.name] = []
-                
-                for applicant in group.applicants:
-                    applicant_score = bank.get_expected_applicant_score(self, applicant.score)
-                    repay_prob = group.score_repay_prob[applicant_score]
-                    outcome = applicant.get_repay_outcome(self)
-                    if outcome:
-                        TPRs[group.name].append(applicant)
-                        utility += bank.get_applicant_evaluation_utility(applicant_score, group)
-                        utility_curve[group.name].append(utility)
-                #plt.plot(list(range(0,len(utility_curve[group.name]))), utility_curve[group.name])      
-                group_sizes.append(len(TPRs[group.name]))
-                              
-            merged_utility_curve = []
-            for group in groups:
-                TPR = TPRs[group.name]
+            max_util[bank.name] = 0
 
-                if len(TPR) != max(group_sizes):             
-                    x = list(range(0, len(TPR)))
-                    x = np.array(x)*(max(group_sizes)/len(TPR))
-                    y = utility_curve[group.name]
-                    z = np.polyfit(x, y, 5)
-                    p = np.poly1d(z)
-                    if len(merged_utility_curve) == 0:
-                        merged_utility_curve = [0] * max(group_sizes)
-                    merged_utility_curve += p(list(range(0,max(group_sizes))))
-                else:
-                    merged_utility_curve += utility_curve[group.name]
-            #plt.plot(list(range(0,len(merged_utility_curve))), merged_utility_curve,label="merged")
-            
-            for group in groups:
-                sel_rate = (len(merged_utility_curve) - np.argmax(list(reversed(merged_utility_curve)))-1)/max(group_sizes)
-                for i in range(0, len(TPRs[group.name])):
-                    if i/len(TPRs[group.name]) < sel_rate and (i+1)/len(TPRs[group.name]) >= sel_rate:
-                        sel_rate = (i+1)/group.size
-                
-                
-                bank.set_expected_group_utility_curve(group, merged_utility_curve)
-                #bank.plot_expected_group_utility_curve(group)
-                selection_rates[bank.name][group.name] = sel_rate
-                max_util[bank.name] = max(merged_utility_curve)
-                #print('Selection rate of ' + bank.name + ' bank for ' + group.name + ' group: ' + str(selection_rates[bank.name][group.name])
+        for group in groups:
+            utility_curves, selected_counts = self.get_expected_utility_curves(banks, group)
+            #last entry with maximal expected utility
+            selected = utility_curves.shape[1] - np.argmax(utility_curves[:, ::-1], axis=1) - 1
+            for i in range(len(banks)):
+                banks[i].set_expected_group_utility_curve(group, utility_curves[i])
+                max_util[banks[i].name] += utility_curves[i, selected[i]]
+                selection_rates[banks[i].name][group.name] = (selected_counts[selected[i]]-1)/group.size
+                #print('Selection rate of ' + banks[i].name + ' bank for ' + group.name + ' group: ' + str(selection_rates[banks[i].name][group.name]))
 
         return [selection_rates, max_util]
     
     
+    #the same share of applicants is selected from every group
+    def get_DP_selection_rate(self, banks, groups):
+        return self.get_constrained_selection_rate(banks, groups, lambda group, scores: np.ones(scores.size))
+
+    #the same share of the expected repayers (true positive rate) is selected from every group
+    #computed from the repay probabilities of the scores, the population is not changed
+    def get_EO_selection_rate(self, banks, groups):
+        return self.get_constrained_selection_rate(banks, groups, lambda group, scores: group.score_repay_prob[scores - self.score_range[0]])
+    
+    
     def get_EO_selection_rate_old(self, banks, groups):
         #Get expected bank utility and set the bank selection rate
         selection_rates = {}
@@ -184,11 +191,11 @@ class Market:
                 TPRs[group.name] = []
                 group_sizes.append(group.size)
                 
-                for applicant in group.applicants:
-                    applicant_score = bank.get_expected_applicant_score(self, applicant.score)
+                for score in group.scores:
+                    applicant_score = bank.get_expected_applicant_score(self, score)
                     utility += bank.get_applicant_evaluation_utility(applicant_score, group)
                     utility_curve[group.name].append(utility)
-                    TPR = group.score_repay_prob[applicant_score]
+                    TPR = group.score_repay_prob[applicant_score - self.score_range[0]]
                     TPRs[group.name].append(TPR)
             
             #add TPR utility curves together
@@ -226,154 +233,23 @@ class Market:
         return [selection_rates, max_util]
         
     
+    #plots are drawn by the plotting module, which is imported only when needed
+    #the market situation plots are saved to path, by default to ../plots/ named after the step
     def plot_bank_interest_rates(self, banks):
-        plt.figure(0)
-        x_axis = self.score_range
-        for bank in banks:
-            y_axis = bank.interest_rate_range
-            plt.plot(x_axis, y_axis ,color=bank.color ,LineStyle= bank.line_style, label= bank.name + " bank interest rates")
-        plt.ylabel('Interest rate')
-        plt.xlabel('Score')
-        plt.title('Dependence of interest rate on score for different banks')
-        plt.grid('on')
-        plt.legend(loc="lower left")
-        plt.show()
-        return 1
-    
+        from demo.src import plotting
+        return plotting.plot_bank_interest_rates(self, banks)
     
     def plot_bank_utility_curves(self, banks, groups):
-        fig, ax = plt.subplots(len(banks), len(groups),figsize=(16,8*len(banks))); 
-        for i in range(len(banks)):
-            for j in range(len(groups)):
-                ax[i,j].plot(list(range(0,len(banks[i].real_group_utility_curve[groups[j].name]))), banks[i].real_group_utility_curve[groups[j].name], color='black',LineStyle=':', label="Bank utility curve")
-                ax[i,j].set_title('Utility curve of ' + str(banks[i].name) + ' bank for ' + str(groups[j].name) + ' group')
-                ax[i,j].set_xlabel('Applicants')
-                ax[i,j].set_ylabel('Bank utility')
-                ax[i,j].legend(loc="upper left")
-                ax[i,j].grid()
-        return 1
+        from demo.src import plotting
+        return plotting.plot_bank_utility_curves(self, banks, groups)
     
-    def plot_market_situation_oligo(self, banks, groups, mean_group_score_change_curve):
-        fig, ax = plt.subplots(3,len(groups),figsize=(16,20))
-        
-        for i in range(len(groups)):
-            ax[0][i].hist(groups[i].get_scores(), range = self.score_range, label='Step ' + str(self.step))
-            ax[0][i].set_title(groups[i].name + " group histogram for " + self.policy + " policy in time step: " + str(self.step))
-            ax[0][i].set_ylabel("Occurence")
-            ax[0][i].set_xlabel("Score")
-            ax[0][i].set_ylim([0,groups[i].size*0.75])
-            ax[0][i].legend(loc="upper left")
-            
-            y_axis = mean_group_score_change_curve[groups[i].name]
-            ax[1][1].plot(list(range(len(mean_group_score_change_curve[groups[i].name]))),y_axis ,color=groups[i].color, label= groups[i].name + " group mean score change")
-                        
-        ax[1][1].set_ylabel('Mean score change')
-        ax[1][1].set_xlabel('Step')
-        ax[1][1].set_title('Mean score change of different groups in time step:' + str(self.step))
-        ax[1][1].grid()
-        ax[1][1].legend(loc="lower left")
-        
-        for bank in banks:
-            ax[1][0].plot(list(range(len(self.max_irates[bank.name]))), self.max_irates[bank.name], color=bank.color, LineStyle = '-', label= bank.name + " bank: max i")
-            ax[1][0].plot(list(range(len(self.min_irates[bank.name]))), self.min_irates[bank.name], color=bank.color, LineStyle = ':', label= bank.name + " bank: min i")
-        ax[1][0].set_ylabel('Interest rate')
-        ax[1][0].set_xlabel('Step')
-        ax[1][0].set_title('Interest rate step:' + str(self.step))
-        #ax[1][0].set_ylim([self.min_interest_rate_range[1],self.max_interest_rate_range[0]])
-        ax[1][0].grid()
-        ax[1][0].legend(loc="upper left")
-        
-        total_loans = np.zeros(self.step+1)
-        total_utility = np.zeros(self.step+1)
-        for group in groups:
-            print("Loans - " + group.name + ": " + str(self.loans[group.name][-1]) + ", Utility - " + group.name + ": " + str(self.utility[group.name][-1]/self.loans[group.name][-1]))
-            
-            total_loans += np.array(self.loans[group.name])
-            total_utility += np.array(self.utility[group.name])
-            ax[2][0].plot(list(range(len(self.loans[group.name]))), self.loans[group.name], color = group.color, LineStyle = group.line_style, label = "Total loans "+ group.name + " group")
-            ax[2][1].plot(list(range(len(self.utility[group.name]))), np.array(self.utility[group.name])/np.array(self.loans[group.name]), color = group.color, LineStyle = group.line_style,label = "Total utility per loan for "+ group.name + " group")
-        print("Loans - Total: " + str(total_loans[-1]) + ", Utility - Total: " + str(total_utility[-1]/total_loans[-1]))
-        
-        ax[2][0].plot(list(range(len(total_loans))), total_loans, color="red", label= "Total loans")
-        ax[2][0].set_ylabel('Number of loans')
-        ax[2][0].set_xlabel('Step')
-        ax[2][0].set_title('Number of loans given by banks to groups: step ' + str(self.step))
-        #ax[2][0].set_yscale('log')
-        ax[2][0].grid()
-        ax[2][0].legend()
-        
-        ax[2][1].plot(list(range(len(total_utility))), np.array(total_utility)/np.array(total_loans), color="red",label= "Total utility per loan")
-        ax[2][1].set_ylabel('Utility')
-        ax[2][1].set_xlabel('Step')
-        ax[2][1].set_title('Bank utility per loan by groups: step ' + str(self.step))
-        #ax[2][1].set_yscale('log')
-        ax[2][1].grid()
-        ax[2][1].legend()
-        print()
-        
-        fig.savefig('../plots/IC_step'+ '%03d' % self.step +'_ER00.png')
-        plt.close(fig)                  
-        return 1
+    def plot_market_situation_oligo(self, banks, groups, mean_group_score_change_curve, path=None):
+        from demo.src import plotting
+        return plotting.plot_market_situation_oligo(self, banks, groups, mean_group_score_change_curve, path=path)
     
-    def plot_market_situation_PC(self, banks, groups, mean_group_score_change_curve):
-        fig, ax = plt.subplots(3,len(groups),figsize=(16,20))
-        
-        for i in range(len(groups)):
-            ax[0][i].hist(groups[i].get_scores(), range = self.score_range, label='Step ' + str(self.step))
-            ax[0][i].set_title(groups[i].name + " group histogram for " + self.policy + " policy in time step: " + str(self.step))
-            ax[0][i].set_ylabel("Occurence")
-            ax[0][i].set_xlabel("Score")
-            ax[0][i].set_ylim([0,groups[i].size*0.75])
-            ax[0][i].legend(loc="upper left")
-            
-            y_axis = mean_group_score_change_curve[groups[i].name]
-            ax[1][1].plot(list(range(len(mean_group_score_change_curve[groups[i].name]))),y_axis ,color=groups[i].color, label= groups[i].name + " group mean score change")
-                        
-        ax[1][1].set_ylabel('Mean score change')
-        ax[1][1].set_xlabel('Step')
-        ax[1][1].set_title('Mean score change of different groups in time step:' + str(self.step))
-        ax[1][1].grid()
-        ax[1][1].legend(loc="lower left")
-                     
-        ax[1][0].plot(list(range(len(self.max_irates[banks[0].name]))), self.max_irates[banks[0].name], color="red", label= "Max market interest rate for score 300")
-        ax[1][0].plot(list(range(len(self.min_irates[banks[0].name]))), self.min_irates[banks[0].name], color="green", label= "Min market interest rate for score 850")
-        ax[1][0].set_ylabel('Interest rate')
-        ax[1][0].set_xlabel('Step')
-        ax[1][0].set_title('Interest rate step:' + str(self.step))
-        ax[1][0].set_ylim([self.min_interest_rate_range[1],self.max_interest_rate_range[0]])
-        ax[1][0].grid()
-        ax[1][0].legend(loc="lower left")
-        
-        total_loans = np.zeros(self.step+1)
-        total_utility = np.zeros(self.step+1)
-        for group in groups:
-            print("Loans - " + group.name + ": " + str(self.loans[group.name][-1]) + ", Utility - " + group.name + ": " + str(self.utility[group.name][-1]/self.loans[group.name][-1]))
-            total_loans += np.array(self.loans[group.name])
-            total_utility += np.array(self.utility[group.name])
-            ax[2][0].plot(list(range(len(self.loans[group.name]))), self.loans[group.name], color = group.color, LineStyle = group.line_style, label = "Total loans "+ group.name + " group")
-            ax[2][1].plot(list(range(len(self.utility[group.name]))), np.array(self.utility[group.name])/np.array(self.loans[group.name]), color = group.color, LineStyle = group.line_style,label = "Total utility per loan "+ group.name + " group")
-        print("Loans - Total: " + str(total_loans[-1]) + ", Utility - Total: " + str(total_utility[-1]/total_loans[-1]))
-        
-        ax[2][0].plot(list(range(len(total_loans))), total_loans, color="red", label= "Total loans")
-        ax[2][0].set_ylabel('Number of loans')
-        ax[2][0].set_xlabel('Step')
-        ax[2][0].set_title('Number of loans given by banks to groups: step ' + str(self.step))
-        #ax[2][0].set_yscale('log')
-        ax[2][0].grid()
-        ax[2][0].legend()
-        
-        ax[2][1].plot(list(range(len(total_utility))), np.array(total_utility)/np.array(total_loans), color="red",label= "Total utility per loan")
-        ax[2][1].set_ylabel('Utility')
-        ax[2][1].set_xlabel('Step')
-        ax[2][1].set_title('Bank utility per loan by groups: step ' + str(self.step))
-        #ax[2][1].set_yscale('log')
-        ax[2][1].grid()
-        ax[2][1].legend()
-        print()  
-        
-        fig.savefig('../plots/PC_step'+ '%03d' % self.step +'_ER00.png')
-        plt.close(fig)         
-        return 1
+    def plot_market_situation_PC(self, banks, groups, mean_group_score_change_curve, path=None):
+        from demo.src import plotting
+        return plotting.plot_market_situation_PC(self, banks, groups, mean_group_score_change_curve, path=path)
     
     def __str__(self):
         return str(self.__class__) + ": " + str(self.__dict__)
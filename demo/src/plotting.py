@@ -0,0 +1,185 @@
+#plots of the simulation classes, imported only when something is plotted so the engine runs without matplotlib
+#the non-interactive Agg backend is used unless MPLBACKEND chooses another one (e.g. in notebooks)
+import os
+
+import numpy as np
+import matplotlib
+if 'MPLBACKEND' not in os.environ:
+    matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+
+#histogram of the group scores
+def plot_histogram(group, market):
+    plt.figure()
+    plt.hist(group.get_scores(), range = market.score_range, label='Step ' + str(market.step))
+    plt.ylabel("Occurence")
+    plt.xlabel("Score")
+    plt.ylim([0,group.size*0.75])
+    plt.legend(loc="upper left")
+    plt.show()
+    return 1
+
+
+def plot_expected_group_utility_curve(bank, applicant_group):
+    plt.plot(list(range(0, len(bank.expected_group_utility_curve[applicant_group.name]))), bank.expected_group_utility_curve[applicant_group.name], color='black',linestyle=':', label="expected bank utility curve")
+    plt.ylabel('Utility')
+    plt.xlabel('Applicants')
+    plt.title('Expected utility curve of ' + bank.name + ' bank for ' + applicant_group.name + ' group')
+    plt.grid('on')
+    plt.legend(loc="lower left")
+    #plt.show()
+    return 1
+
+
+def plot_bank_interest_rates(market, banks):
+    plt.figure(0)
+    x_axis = market.score_range
+    for bank in banks:
+        y_axis = bank.interest_rate_range
+        plt.plot(x_axis, y_axis ,color=bank.color ,linestyle= bank.line_style, label= bank.name + " bank interest rates")
+    plt.ylabel('Interest rate')
+    plt.xlabel('Score')
+    plt.title('Dependence of interest rate on score for different banks')
+    plt.grid('on')
+    plt.legend(loc="lower left")
+    plt.show()
+    return 1
+
+
+def plot_bank_utility_curves(market, banks, groups):
+    fig, ax = plt.subplots(len(banks), len(groups),figsize=(16,8*len(banks)));
+    for i in range(len(banks)):
+        for j in range(len(groups)):
+            ax[i,j].plot(list(range(0,len(banks[i].real_group_utility_curve[groups[j].name]))), banks[i].real_group_utility_curve[groups[j].name], color='black',linestyle=':', label="Bank utility curve")
+            ax[i,j].set_title('Utility curve of ' + str(banks[i].name) + ' bank for ' + str(groups[j].name) + ' group')
+            ax[i,j].set_xlabel('Applicants')
+            ax[i,j].set_ylabel('Bank utility')
+            ax[i,j].legend(loc="upper left")
+            ax[i,j].grid()
+    return 1
+
+
+#overview of the market in the current step, saved as a png
+def plot_market_situation_oligo(market, banks, groups, mean_group_score_change_curve, path=None):
+    fig, ax = plt.subplots(3,len(groups),figsize=(16,20))
+
+    for i in range(len(groups)):
+        ax[0][i].hist(groups[i].get_scores(), range = market.score_range, label='Step ' + str(market.step))
+        ax[0][i].set_title(groups[i].name + " group histogram for " + market.policy + " policy in time step: " + str(market.step))
+        ax[0][i].set_ylabel("Occurence")
+        ax[0][i].set_xlabel("Score")
+        ax[0][i].set_ylim([0,groups[i].size*0.75])
+        ax[0][i].legend(loc="upper left")
+
+        y_axis = mean_group_score_change_curve[groups[i].name]
+        ax[1][1].plot(list(range(len(mean_group_score_change_curve[groups[i].name]))),y_axis ,color=groups[i].color, label= groups[i].name + " group mean score change")
+
+    ax[1][1].set_ylabel('Mean score change')
+    ax[1][1].set_xlabel('Step')
+    ax[1][1].set_title('Mean score change of different groups in time step:' + str(market.step))
+    ax[1][1].grid()
+    ax[1][1].legend(loc="lower left")
+
+    for bank in banks:
+        ax[1][0].plot(list(range(len(market.max_irates[bank.name]))), market.max_irates[bank.name], color=bank.color, linestyle = '-', label= bank.name + " bank: max i")
+        ax[1][0].plot(list(range(len(market.min_irates[bank.name]))), market.min_irates[bank.name], color=bank.color, linestyle = ':', label= bank.name + " bank: min i")
+    ax[1][0].set_ylabel('Interest rate')
+    ax[1][0].set_xlabel('Step')
+    ax[1][0].set_title('Interest rate step:' + str(market.step))
+    #ax[1][0].set_ylim([market.min_interest_rate_range[1],market.max_interest_rate_range[0]])
+    ax[1][0].grid()
+    ax[1][0].legend(loc="upper left")
+
+    total_loans = np.zeros(market.step+1)
+    total_utility = np.zeros(market.step+1)
+    for group in groups:
+        print("Loans - " + group.name + ": " + str(market.loans[group.name][-1]) + ", Utility - " + group.name + ": " + str(market.utility[group.name][-1]/market.loans[group.name][-1]))
+
+        total_loans += np.array(market.loans[group.name])
+        total_utility += np.array(market.utility[group.name])
+        ax[2][0].plot(list(range(len(market.loans[group.name]))), market.loans[group.name], color = group.color, linestyle = group.line_style, label = "Total loans "+ group.name + " group")
+        ax[2][1].plot(list(range(len(market.utility[group.name]))), np.array(market.utility[group.name])/np.array(market.loans[group.name]), color = group.color, linestyle = group.line_style,label = "Total utility per loan for "+ group.name + " group")
+    print("Loans - Total: " + str(total_loans[-1]) + ", Utility - Total: " + str(total_utility[-1]/total_loans[-1]))
+
+    ax[2][0].plot(list(range(len(total_loans))), total_loans, color="red", label= "Total loans")
+    ax[2][0].set_ylabel('Number of loans')
+    ax[2][0].set_xlabel('Step')
+    ax[2][0].set_title('Number of loans given by banks to groups: step ' + str(market.step))
+    #ax[2][0].set_yscale('log')
+    ax[2][0].grid()
+    ax[2][0].legend()
+
+    ax[2][1].plot(list(range(len(total_utility))), np.array(total_utility)/np.array(total_loans), color="red",label= "Total utility per loan")
+    ax[2][1].set_ylabel('Utility')
+    ax[2][1].set_xlabel('Step')
+    ax[2][1].set_title('Bank utility per loan by groups: step ' + str(market.step))
+    #ax[2][1].set_yscale('log')
+    ax[2][1].grid()
+    ax[2][1].legend()
+    print()
+
+    fig.savefig(path if path is not None else '../plots/IC_step'+ '%03d' % market.step +'_ER00.png')
+    plt.close(fig)
+    return 1
+
+
+def plot_market_situation_PC(market, banks, groups, mean_group_score_change_curve, path=None):
+    fig, ax = plt.subplots(3,len(groups),figsize=(16,20))
+
+    for i in range(len(groups)):
+        ax[0][i].hist(groups[i].get_scores(), range = market.score_range, label='Step ' + str(market.step))
+        ax[0][i].set_title(groups[i].name + " group histogram for " + market.policy + " policy in time step: " + str(market.step))
+        ax[0][i].set_ylabel("Occurence")
+        ax[0][i].set_xlabel("Score")
+        ax[0][i].set_ylim([0,groups[i].size*0.75])
+        ax[0][i].legend(loc="upper left")
+
+        y_axis = mean_group_score_change_curve[groups[i].name]
+        ax[1][1].plot(list(range(len(mean_group_score_change_curve[groups[i].name]))),y_axis ,color=groups[i].color, label= groups[i].name + " group mean score change")
+
+    ax[1][1].set_ylabel('Mean score change')
+    ax[1][1].set_xlabel('Step')
+    ax[1][1].set_title('Mean score change of different groups in time step:' + str(market.step))
+    ax[1][1].grid()
+    ax[1][1].legend(loc="lower left")
+
+    ax[1][0].plot(list(range(len(market.max_irates[banks[0].name]))), market.max_irates[banks[0].name], color="red", label= "Max market interest rate for score 300")
+    ax[1][0].plot(list(range(len(market.min_irates[banks[0].name]))), market.min_irates[banks[0].name], color="green", label= "Min market interest rate for score 850")
+    ax[1][0].set_ylabel('Interest rate')
+    ax[1][0].set_xlabel('Step')
+    ax[1][0].set_title('Interest rate step:' + str(market.step))
+    ax[1][0].set_ylim([market.min_interest_rate_range[1],market.max_interest_rate_range[0]])
+    ax[1][0].grid()
+    ax[1][0].legend(loc="lower left")
+
+    total_loans = np.zeros(market.step+1)
+    total_utility = np.zeros(market.step+1)
+    for group in groups:
+        print("Loans - " + group.name + ": " + str(market.loans[group.name][-1]) + ", Utility - " + group.name + ": " + str(market.utility[group.name][-1]/market.loans[group.name][-1]))
+        total_loans += np.array(market.loans[group.name])
+        total_utility += np.array(market.utility[group.name])
+        ax[2][0].plot(list(range(len(market.loans[group.name]))), market.loans[group.name], color = group.color, linestyle = group.line_style, label = "Total loans "+ group.name + " group")
+        ax[2][1].plot(list(range(len(market.utility[group.name]))), np.array(market.utility[group.name])/np.array(market.loans[group.name]), color = group.color, linestyle = group.line_style,label = "Total utility per loan "+ group.name + " group")
+    print("Loans - Total: " + str(total_loans[-1]) + ", Utility - Total: " + str(total_utility[-1]/total_loans[-1]))
+
+    ax[2][0].plot(list(range(len(total_loans))), total_loans, color="red", label= "Total loans")
+    ax[2][0].set_ylabel('Number of loans')
+    ax[2][0].set_xlabel('Step')
+    ax[2][0].set_title('Number of loans given by banks to groups: step ' + str(market.step))
+    #ax[2][0].set_yscale('log')
+    ax[2][0].grid()
+    ax[2][0].legend()
+
+    ax[2][1].plot(list(range(len(total_utility))), np.array(total_utility)/np.array(total_loans), color="red",label= "Total utility per loan")
+    ax[2][1].set_ylabel('Utility')
+    ax[2][1].set_xlabel('Step')
+    ax[2][1].set_title('Bank utility per loan by groups: step ' + str(market.step))
+    #ax[2][1].set_yscale('log')
+    ax[2][1].grid()
+    ax[2][1].legend()
+    print()
+
+    fig.savefig(path if path is not None else '../plots/PC_step'+ '%03d' % market.step +'_ER00.png')
+    plt.close(fig)
+    return 1
@@ -0,0 +1,98 @@
+#wall time of the phases of every simulation step and counters of the work done in them
+#a simulation without profiling uses NO_PROFILE, whose phases and counters do nothing
+import contextlib
+import json
+import time
+
+
+#Times and counters of one run, steps are recorded separately
+#phases may be nested, the time of a phase does not include the time of the phases started inside it
+class Run_profile:
+    def __init__(self, policy=None, clock=time.perf_counter):
+        self.policy = policy
+        self.clock = clock
+        self.steps = []
+        self.phases = None
+        self.counters = None
+        self.running = []
+        self.started = clock()
+
+    def begin_step(self, step):
+        self.phases = {}
+        self.counters = {}
+        self.steps.append({'step': step, 'phases': self.phases, 'counters': self.counters})
+
+    #time outside of a step is not recorded
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.phases is None:
+            yield
+            return
+        now = self.clock()
+        if self.running:
+            self.pause(now)
+        self.running.append([name, now])
+        try:
+            yield
+        finally:
+            now = self.clock()
+            self.pause(now)
+            self.running.pop()
+            if self.running:
+                self.running[-1][1] = now
+
+    def pause(self, now):
+        name, start = self.running[-1]
+        self.phases[name] = self.phases.get(name, 0) + now - start
+
+    def count(self, name, number=1):
+        if self.counters is not None:
+            self.counters[name] = self.counters.get(name, 0) + int(number)
+
+    #summary over all steps with the records of every step
+    def get_report(self):
+        phases = {}
+        counters = {}
+        for step in self.steps:
+            for name, seconds in step['phases'].items():
+                phase = phases.setdefault(name, {'total': 0, 'max': 0, 'steps': 0})
+                phase['total'] += seconds
+                phase['max'] = max(phase['max'], seconds)
+                phase['steps'] += 1
+            for name, number in step['counters'].items():
+                counters[name] = counters.get(name, 0) + number
+        for phase in phases.values():
+            phase['mean'] = phase['total']/phase['steps']
+        return {'policy': self.policy, 'steps': len(self.steps), 'wall_time': self.clock() - self.started,
+                'phases': phases, 'counters': counters, 'per_step': self.steps}
+
+    def to_json(self, indent=None):
+        return json.dumps(self.get_report(), indent=indent)
+
+    def save_report(self, path):
+        with open(path, 'w') as report_file:
+            report_file.write(self.to_json(indent=1))
+        return path
+
+
+#stands in for a profile when profiling is off, a phase costs one call and an empty with block
+class Null_profile:
+    policy = None
+
+    def __init__(self):
+        self.context = contextlib.nullcontext()
+
+    def begin_step(self, step):
+        pass
+
+    def phase(self, name):
+        return self.context
+
+    def count(self, name, number=1):
+        pass
+
+    def get_report(self):
+        return None
+
+
+NO_PROFILE = Null_profile()
@@ -0,0 +1,136 @@
+#per step figures drawn next to a running simulation
+#the simulation only copies a small snapshot of every step, a process pool draws the frames from the snapshots
+import concurrent.futures
+import contextlib
+import os
+import threading
+
+import numpy as np
+
+#snapshots waiting for or being drawn, adding a frame blocks only when this many are pending
+MAX_PENDING_FRAMES = 16
+
+
+#the attributes of the market the market situation plots read, curves are copied up to the current step
+class Market_snapshot:
+    def __init__(self, market):
+        self.step = market.step
+        self.policy = market.policy
+        self.score_range = list(market.score_range)
+        self.max_interest_rate_range = list(market.max_interest_rate_range)
+        self.min_interest_rate_range = list(market.min_interest_rate_range)
+        self.loans = {name: list(values) for name, values in market.loans.items()}
+        self.utility = {name: list(values) for name, values in market.utility.items()}
+        self.max_irates = {name: list(values) for name, values in market.max_irates.items()}
+        self.min_irates = {name: list(values) for name, values in market.min_irates.items()}
+
+
+class Bank_snapshot:
+    def __init__(self, bank):
+        self.name = bank.name
+        self.color = bank.color
+        self.line_style = bank.line_style
+
+
+#scores are kept as the number of applicants per score, a few hundred counts instead of one entry per applicant
+class Group_snapshot:
+    def __init__(self, group, market):
+        self.name = group.name
+        self.color = group.color
+        self.line_style = group.line_style
+        self.size = group.size
+        self.min_score = market.score_range[0]
+        self.score_counts = np.bincount(group.get_scores() - self.min_score, minlength=market.score_range[1] - self.min_score + 1)
+
+    #the same scores in ascending order, enough for histograms
+    def get_scores(self):
+        return np.repeat(np.arange(self.min_score, self.min_score + self.score_counts.size), self.score_counts)
+
+
+def get_snapshot(simulation, group_mean_score_change_curve):
+    market = simulation.market
+    return {'market': Market_snapshot(market),
+            'banks': [Bank_snapshot(bank) for bank in simulation.banks],
+            'groups': [Group_snapshot(group, market) for group in simulation.groups],
+            'mean_score_change': {name: list(values) for name, values in group_mean_score_change_curve.items()}}
+
+
+#worker of the renderer pool, the summary lines the plots print are dropped
+def render_frame(snapshot, path, plot):
+    from demo.src import plotting
+    plot_function = getattr(plotting, 'plot_market_situation_' + plot)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        plot_function(snapshot['market'], snapshot['banks'], snapshot['groups'], snapshot['mean_score_change'], path=path)
+    return path
+
+
+#Draws a market situation frame for every step of a run in a process pool
+#add_frame fits the on_step argument of run_oligopoly: renderer = Frame_renderer('../plots/'); simulation.run_oligopoly(steps, on_step=renderer.add_frame)
+class Frame_renderer:
+    def __init__(self, out_dir, plot='oligo', prefix=None, processes=None, max_pending=MAX_PENDING_FRAMES):
+        if plot not in ('oligo', 'PC'):
+            raise ValueError("Unknown plot " + plot)
+        self.out_dir = out_dir
+        self.plot = plot
+        self.prefix = prefix if prefix is not None else ('IC' if plot == 'oligo' else 'PC')
+        os.makedirs(out_dir, exist_ok=True)
+        self.executor = concurrent.futures.ProcessPoolExecutor(processes)
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.futures = []
+
+    def get_frame_path(self, step):
+        return os.path.join(self.out_dir, self.prefix + '_step' + '%03d' % step + '.png')
+
+    def add_frame(self, simulation, group_mean_score_change_curve):
+        snapshot = get_snapshot(simulation, group_mean_score_change_curve)
+        self.pending.acquire()
+        try:
+            future = self.executor.submit(render_frame, snapshot, self.get_frame_path(snapshot['market'].step), self.plot)
+        except BaseException:
+            self.pending.release()
+            raise
+        future.add_done_callback(lambda future: self.pending.release())
+        self.futures.append(future)
+        return future
+
+    #waits for the pending frames, returns the paths of all frames in step order
+    #the first error of a frame is raised after every frame has finished
+    def close(self):
+        self.executor.shutdown(wait=True)
+        errors = [future.exception() for future in self.futures if future.exception() is not None]
+        if errors:
+            raise errors[0]
+        return [future.result() for future in self.futures]
+
+
+#final pass: frames joined into one animation, a gif unless the path names another format matplotlib can write
+def make_animation(frames, path, fps=4):
+    from demo.src.plotting import plt
+    import matplotlib.animation as animation
+
+    first = plt.imread(frames[0])
+    fig = plt.figure(figsize=(first.shape[1]/100, first.shape[0]/100), dpi=100)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.axis('off')
+    image = ax.imshow(first)
+
+    def draw(frame):
+        image.set_data(plt.imread(frame))
+        return image,
+
+    writer = animation.PillowWriter(fps=fps) if path.endswith('.gif') else animation.FFMpegWriter(fps=fps)
+    animation.FuncAnimation(fig, draw, frames=frames, blit=True).save(path, writer=writer, dpi=100)
+    plt.close(fig)
+    return path
+
+
+#runs a simulation with a frame for every step, the animation is made when animation_path is given
+def run_rendered(simulation, steps, out_dir, plot='oligo', processes=None, animation_path=None, fps=4):
+    renderer = Frame_renderer(out_dir, plot=plot, processes=processes)
+    try:
+        result = simulation.run_oligopoly(steps, on_step=renderer.add_frame)
+    finally:
+        frames = renderer.close()
+    if animation_path is not None and frames:
+        make_animation(frames, animation_path, fps)
+    return result, frames
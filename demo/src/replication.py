@@ -0,0 +1,143 @@
+import multiprocessing
+
+import numpy as np
+
+from demo.src.simulation import Simulation
+
+
+#replicates whose values are kept, quantiles are exact up to this many replicates
+EXACT_QUANTILE_REPLICATES = 256
+
+
+#streaming estimate of one quantile for many series at once (P-square algorithm, Jain & Chlamtac 1985)
+#starts from the observations so far (rows, at least 5) and keeps 5 markers per series, so the memory does not depend on the number of observations
+class P2_quantile:
+    def __init__(self, quantile, values):
+        count, size = values.shape
+        self.quantile = quantile
+        self.count = count
+        self.increments = np.array([0, quantile/2, quantile, (1+quantile)/2, 1])[:, None]
+        self.desired_positions = (count - 1)*self.increments*np.ones(size)
+        #markers start at the order statistics nearest to their desired positions
+        positions = np.round(self.desired_positions[:, 0]).astype(int)
+        for i in range(1, 4):
+            positions[i] = min(max(positions[i], positions[i-1] + 1), count - 5 + i)
+        self.heights = np.sort(values, axis=0)[positions]
+        self.positions = positions[:, None]*np.ones(size)
+
+    def add(self, values):
+        self.count += 1
+        columns = np.arange(values.size)
+        #extreme markers follow minimum and maximum, the cell of the observation moves the markers above it
+        self.heights[0] = np.minimum(self.heights[0], values)
+        self.heights[4] = np.maximum(self.heights[4], values)
+        cells = np.clip(np.sum(values >= self.heights[1:4], axis=0), 0, 3)
+        self.positions += np.arange(5)[:, None] > cells
+        self.desired_positions += self.increments
+
+        #move middle markers towards their desired positions with parabolic or linear prediction
+        for i in range(1, 4):
+            difference = self.desired_positions[i] - self.positions[i]
+            move_up = (difference >= 1) & (self.positions[i+1] - self.positions[i] > 1)
+            move_down = (difference <= -1) & (self.positions[i-1] - self.positions[i] < -1)
+            direction = np.where(move_up, 1.0, np.where(move_down, -1.0, 0.0))
+            moving = columns[direction != 0]
+            if moving.size == 0:
+                continue
+            d = direction[moving]
+            q, n = self.heights[:, moving], self.positions[:, moving]
+            parabolic = q[i] + d/(n[i+1]-n[i-1]) * ((n[i]-n[i-1]+d)*(q[i+1]-q[i])/(n[i+1]-n[i]) + (n[i+1]-n[i]-d)*(q[i]-q[i-1])/(n[i]-n[i-1]))
+            neighbour = np.where(d > 0, i+1, i-1)
+            linear = q[i] + d*(q[neighbour, np.arange(moving.size)]-q[i])/(n[neighbour, np.arange(moving.size)]-n[i])
+            self.heights[i, moving] = np.where((q[i-1] < parabolic) & (parabolic < q[i+1]), parabolic, linear)
+            self.positions[i, moving] += d
+        return self.heights
+
+    def get_value(self):
+        return self.heights[2].copy()
+
+
+#running mean, standard deviation and quantiles of many series (Welford's algorithm for the moments)
+#the values of the first exact_replicates replicates are kept for exact quantiles, later ones update P-square estimates started from them
+class Replication_summary:
+    def __init__(self, size, quantiles=(0.05, 0.5, 0.95), exact_replicates=EXACT_QUANTILE_REPLICATES):
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.squares = np.zeros(size)
+        self.quantiles = quantiles
+        self.values = np.zeros((max(exact_replicates, 5), size))
+        self.estimates = None
+
+    def add(self, values):
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta/self.count
+        self.squares += delta*(values - self.mean)
+        if self.estimates is not None:
+            for estimate in self.estimates:
+                estimate.add(values)
+        else:
+            self.values[self.count - 1] = values
+            if self.count == len(self.values):
+                self.estimates = [P2_quantile(quantile, self.values) for quantile in self.quantiles]
+                self.values = None
+        return self.count
+
+    def get_std(self):
+        if self.count < 2:
+            return np.zeros(self.mean.size)
+        return np.sqrt(self.squares/(self.count-1))
+
+    def get_quantiles(self):
+        if self.estimates is not None:
+            return {estimate.quantile: estimate.get_value() for estimate in self.estimates}
+        return {quantile: np.quantile(self.values[:self.count], quantile, axis=0) for quantile in self.quantiles}
+
+
+#per step series of one simulation run, keyed by (curve, group or bank name)
+def get_replicate_series(market, banks, groups, group_mean_score_change_curve):
+    series = {}
+    for group in groups:
+        series[('mean_score_change', group.name)] = group_mean_score_change_curve[group.name]
+        series[('loans', group.name)] = market.loans[group.name]
+        series[('utility', group.name)] = market.utility[group.name]
+    for bank in banks:
+        series[('max_irates', bank.name)] = market.max_irates[bank.name]
+        series[('min_irates', bank.name)] = market.min_irates[bank.name]
+    return series
+
+
+#worker of the process pool, runs one replicate and returns its series as one matrix (series x steps)
+def run_replicate(task):
+    scenario, steps, seed, engine = task
+    simulation = engine(scenario=scenario, seed=seed, verbose=False)
+    banks, groups, group_mean_score_change_curve = simulation.run_oligopoly(steps)
+    series = get_replicate_series(simulation.market, banks, groups, group_mean_score_change_curve)
+    return list(series), np.array([series[key] for key in series], dtype=float)
+
+
+#runs the scenario once for every seed on a process pool and aggregates the results while they arrive
+#returns {curve: {name: {'mean', 'std', 'quantiles': {quantile: values}}}} with one value per step
+def run_replications(scenario, steps, seeds, processes=None, quantiles=(0.05, 0.5, 0.95), engine=Simulation):
+    tasks = ((scenario, steps, seed, engine) for seed in seeds)
+    keys = None
+    summary = None
+    with multiprocessing.Pool(processes) as pool:
+        #results come in seed order, so the quantile estimates do not depend on the scheduling
+        for replicate_keys, values in pool.imap(run_replicate, tasks):
+            if summary is None:
+                keys = replicate_keys
+                summary = Replication_summary(values.size, quantiles)
+            summary.add(values.ravel())
+
+    if summary is None:
+        return {}
+    shape = (len(keys), -1)
+    mean, std = summary.mean.reshape(shape), summary.get_std().reshape(shape)
+    quantile_values = {quantile: values.reshape(shape) for quantile, values in summary.get_quantiles().items()}
+    result = {}
+    for k, (curve, name) in enumerate(keys):
+        result.setdefault(curve, {})[name] = {'mean': mean[k], 'std': std[k],
+                                              'quantiles': {quantile: values[k] for quantile, values in quantile_values.items()},
+                                              'replications': summary.count}
+    return result
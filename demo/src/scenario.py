@@ -0,0 +1,70 @@
+#simulation setting as plain dictionaries, so a simulation can be built without the database (e.g. in worker processes)
+
+import copy
+
+#setting names and defaults follow the fields of the Market, Bank and Applicant_group models
+MARKET_DEFAULTS = dict(policy="Max. utility", policy_color="#000000", score_range_min=300, score_range_max=850,
+                       repay_score=75, default_score=-150, max_ir_range=0.5, min_ir_range=0.001,
+                       plane_range_min=0, plane_range_max=1, plane_slice_step=0.01)
+
+BANK_DEFAULTS = dict(name="bank", color="#B80F0A", line_style="-", low_score_interest_rate=0.15, high_score_interest_rate=0.06,
+                     score_shift=0, utility_repaid=1, utility_default=-4, interest_change_up=0.01, interest_change_down=-0.01)
+
+GROUP_DEFAULTS = dict(name="White", color="#C0C0C0", line_style="-", size=1000, loan_demand=0.1, error_rate=0.1,
+                      score_error=150, interest_rate_limit=0.3)
+
+
+#same setting as the default models of a new session
+def get_default_scenario():
+    return complete_scenario({
+        'market': dict(policy="Max. utility"),
+        'banks': [dict(name="reference bank", color="red", line_style='-', low_score_interest_rate=0.15, high_score_interest_rate=0.06),
+                  dict(name="conservative bank", color="blue", line_style='--', low_score_interest_rate=0.18, high_score_interest_rate=0.04, score_shift=-25),
+                  dict(name="risk taking bank", color="green", line_style=':', low_score_interest_rate=0.1, high_score_interest_rate=0.08, score_shift=50)],
+        'groups': [dict(name="White", color="grey", line_style='-', size=880, error_rate=0.1, score_error=-150, interest_rate_limit=0.3),
+                   dict(name="Black", color="black", line_style=':', size=120, error_rate=0.1, score_error=150, interest_rate_limit=0.3)],
+    })
+
+
+#copy of the scenario with missing settings filled in with model defaults
+def complete_scenario(scenario):
+    return {
+        'market': dict(MARKET_DEFAULTS, **scenario.get('market', {})),
+        'banks': [dict(BANK_DEFAULTS, **bank) for bank in scenario.get('banks', [])],
+        'groups': [dict(GROUP_DEFAULTS, **group) for group in scenario.get('groups', [])],
+    }
+
+
+#setting of a session read from the database
+def get_session_scenario(session_id):
+    from django.forms.models import model_to_dict
+    from ..models import Market as Market_model
+    from ..models import Bank as Bank_model
+    from ..models import Applicant_group as Group_model
+
+    market_instance = Market_model.objects.get(session_id=session_id)
+    return complete_scenario({
+        'market': model_to_dict(market_instance, fields=list(MARKET_DEFAULTS)),
+        'banks': [model_to_dict(bank, fields=list(BANK_DEFAULTS)) for bank in Bank_model.objects.filter(session_id=session_id)],
+        'groups': [model_to_dict(group, fields=list(GROUP_DEFAULTS)) for group in Group_model.objects.filter(session_id=session_id)],
+    })
+
+
+
+#copy of the scenario with one setting changed
+#path is 'market.<setting>' or '<banks|groups>.<index, name or *>.<setting>', e.g. 'banks.*.score_shift' or 'groups.Black.loan_demand'
+def set_setting(scenario, path, value):
+    scenario = copy.deepcopy(scenario)
+    parts = path.split('.')
+    section, selector, setting = parts[0], '.'.join(parts[1:-1]), parts[-1]
+    if section == 'market':
+        items = [scenario['market']]
+    elif section in ('banks', 'groups'):
+        items = [item for i, item in enumerate(scenario[section]) if selector in ('*', str(i), item.get('name'))]
+        if not items:
+            raise ValueError("No " + section + " matching " + selector + " in scenario")
+    else:
+        raise ValueError("Unknown setting path " + path)
+    for item in items:
+        item[setting] = value
+    return scenario
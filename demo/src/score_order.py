@@ -0,0 +1,30 @@
+import numpy as np
+
+#Applicant counts per score bucket of one group, kept up to date by moving only the applicants whose score changed
+class Score_order:
+    def __init__(self, scores, score_range):
+        self.score_range = score_range
+        self.score_axis = np.arange(score_range[0], score_range[1]+1)
+        self.counts = np.bincount(scores - score_range[0], minlength=self.score_axis.size)
+        #applicants which may be out of descending order, initial scores are not assumed sorted
+        self.unsorted = scores.size
+
+    def move(self, old_scores, new_scores):
+        self.counts -= np.bincount(old_scores - self.score_range[0], minlength=self.score_axis.size)
+        self.counts += np.bincount(new_scores - self.score_range[0], minlength=self.score_axis.size)
+        self.unsorted += np.count_nonzero(old_scores != new_scores)
+        return self.counts
+
+    def is_sorted(self):
+        return self.unsorted == 0
+
+    #positions of applicants in descending score order, ties keep their previous order
+    def get_descending_order(self, scores):
+        #buckets are counted from the highest score, numpy sorts 16 bit keys with a stable counting (radix) sort
+        buckets = (self.score_range[1] - scores).astype(np.uint16 if self.score_axis.size <= 2**16 else np.uint32)
+        order = np.argsort(buckets, kind='stable')
+        self.unsorted = 0
+        return order
+
+    def get_mean_score(self):
+        return np.dot(self.counts, self.score_axis)/np.sum(self.counts)
@@ -1,98 +1,128 @@
 import numpy as np
-import random
-
-#django model classes
-from ..models import Market as Market_model
-from ..models import Bank as Bank_model
-from ..models import Applicant_group as Group_model
 
 import demo.src.fico as fico
 import demo.src.support_functions as sf
+from demo.src.scenario import get_session_scenario, complete_scenario
+from demo.src.profiling import Run_profile, NO_PROFILE
 
 #main model classses
 from demo.src.market import Market
 from demo.src.bank import Bank
 from demo.src.applicant_group import Applicant_group
-from demo.src.applicant import Applicant
 
 
 DATA_DIR = 'demo/data/'
 
+#first spawn key of the random streams used to initialize groups and to run steps
+INIT_STREAM = 0
+STEP_STREAM = 1
+
 
 class Simulation:
 
-    #Creates instances for simulation from DB
-    def __init__(self, session_id):
-        print("Simulation initializing")
+    #Creates instances for simulation from DB or from a scenario dict (see scenario.py), the seed makes the run reproducible
+    #with profile=True the phases of every step are timed, see get_profile_report
+    def __init__(self, session_id=None, seed=None, scenario=None, verbose=True, profile=False):
+        self.verbose = verbose
+        self.log("Simulation initializing")
+        self.seed_sequence = np.random.SeedSequence(seed)
+        if scenario is None:
+            scenario = get_session_scenario(session_id)
+        scenario = complete_scenario(scenario)
+        self.scenario = scenario
+        self.group_mean_score_change_curve = None
         #Set up main simulation classes according to setting
-        market_instance = Market_model.objects.get(session_id=session_id)
-        self.market = Market(policy=market_instance.policy, policy_color=market_instance.policy_color,
-            score_range=[market_instance.score_range_min,market_instance.score_range_max],
-            repay_score=market_instance.repay_score, default_score=market_instance.default_score,
-            max_interest_rate_range = [market_instance.max_ir_range,market_instance.max_ir_range],
-            min_interest_rate_range=[market_instance.min_ir_range,market_instance.min_ir_range],
-            plane_range=[market_instance.plane_range_min,market_instance.plane_range_max],
-            plane_slice_step= market_instance.plane_slice_step)
-
-        bank_instances = Bank_model.objects.filter(session_id=session_id)
+        market_setting = scenario['market']
+        self.market = Market(policy=market_setting['policy'], policy_color=market_setting['policy_color'],
+            score_range=[market_setting['score_range_min'],market_setting['score_range_max']],
+            repay_score=market_setting['repay_score'], default_score=market_setting['default_score'],
+            max_interest_rate_range = [market_setting['max_ir_range'],market_setting['max_ir_range']],
+            min_interest_rate_range=[market_setting['min_ir_range'],market_setting['min_ir_range']],
+            plane_range=[market_setting['plane_range_min'],market_setting['plane_range_max']],
+            plane_slice_step= market_setting['plane_slice_step'])
+        self.profile = Run_profile(market_setting['policy']) if profile else NO_PROFILE
+        self.market.profile = self.profile
+
         self.banks =[]
-        for bank_instance in bank_instances:
-            self.banks.append(Bank(name=bank_instance.name, color=bank_instance.color, line_style=bank_instance.line_style,
-                                   interest_rate_range=[bank_instance.low_score_interest_rate,bank_instance.high_score_interest_rate],
-                                   interest_change_up=bank_instance.interest_change_up,interest_change_down=bank_instance.interest_change_down,
-                                   market=self.market, score_shift=bank_instance.score_shift, utility_repaid=bank_instance.utility_repaid,
-                                   utility_default=bank_instance.utility_default))
-
-        group_instances = Group_model.objects.filter(session_id=session_id)
-        repays, applicant_totals, ref_applicant_scores = self.prepare_initial_group_data(group_instances)
+        for bank_setting in scenario['banks']:
+            self.banks.append(Bank(name=bank_setting['name'], color=bank_setting['color'], line_style=bank_setting['line_style'],
+                                   interest_rate_range=[bank_setting['low_score_interest_rate'],bank_setting['high_score_interest_rate']],
+                                   interest_change_up=bank_setting['interest_change_up'],interest_change_down=bank_setting['interest_change_down'],
+                                   market=self.market, score_shift=bank_setting['score_shift'], utility_repaid=bank_setting['utility_repaid'],
+                                   utility_default=bank_setting['utility_default']))
+
+        group_settings = scenario['groups']
+        repays, applicant_totals, ref_applicant_scores = self.prepare_initial_group_data(group_settings)
         self.groups = []
         i=0
-        for group_instance in group_instances:
-            self.groups.append(Applicant_group(name=group_instance.name, color=group_instance.color, line_style=group_instance.line_style,
-                                               size=applicant_totals[i], scores=ref_applicant_scores[i], loan_demand=group_instance.loan_demand,
-                                               error_rate=group_instance.error_rate, score_error=group_instance.score_error, market=self.market,
-                                               repays=repays, ir_limit=group_instance.interest_rate_limit))
+        for group_setting in group_settings:
+            self.groups.append(self.create_group(group_setting, applicant_totals[i], ref_applicant_scores[i], repays))
             i+=1
 
-
-
-    def run_oligopoly(self, steps):
+    #phase times and counters of the steps run so far as a dict ready for json, None without profiling
+    def get_profile_report(self):
+        return self.profile.get_report()
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    #independent random stream identified by its key, e.g. (STEP_STREAM, step, group index)
+    #streams do not depend on each other, so any of them can be recreated without replaying the others
+    def get_rng(self, *key):
+        return np.random.default_rng(np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=self.seed_sequence.spawn_key + key))
+
+    def create_group(self, group_setting, size, scores, repays):
+        return Applicant_group(name=group_setting['name'], color=group_setting['color'], line_style=group_setting['line_style'],
+                               size=size, scores=scores, loan_demand=group_setting['loan_demand'],
+                               error_rate=group_setting['error_rate'], score_error=group_setting['score_error'], market=self.market,
+                               repays=repays, ir_limit=group_setting['interest_rate_limit'], rng=self.get_rng(INIT_STREAM, len(self.groups)))
+
+    #one step of loans for one group
+    #returns number of applicants, loans and utility per bank and the utility curve of every bank
+    def give_loans(self, group):
+        #select part of customer base at random according to group loan demand
+        applicants = np.sort(group.rng.choice(group.size, int(group.size*group.loan_demand), replace=False))
+
+        #give loans to all selected customers at once and collect outcomes per bank
+        lenders, loan_outcomes, loan_utilities = self.market.allocate_loans(self.banks, group, applicants)
+        group_loans = np.bincount(lenders, minlength=len(self.banks))
+        group_utilities = np.bincount(lenders, weights=loan_utilities, minlength=len(self.banks))
+        utility_curves = [np.cumsum(loan_utilities[lenders == k]) for k in range(len(self.banks))]
+        return len(applicants), group_loans, group_utilities, utility_curves
+
+    #on_step(simulation, group_mean_score_change_curve) is called after every step, e.g. to report progress
+    def run_oligopoly(self, steps, on_step=None):
         market=self.market
         banks=self.banks
         groups=self.groups
+        profile=self.profile
 
-        #init values of model classes
-        for bank in banks:
-            market.max_irates[bank.name] = []
-            market.min_irates[bank.name] = []
-            market.max_irates[bank.name].append(bank.interest_rate_range[0])
-            market.min_irates[bank.name].append(bank.interest_rate_range[1])
-
-            for group in groups:
-                bank.N_loan_curves[group.name] = []
-                bank.total_utility_curves[group.name] = []
-
-        group_mean_score_change_curve = {}
+        #init values of model classes, a simulation restored from a checkpoint continues its curves
+        if self.group_mean_score_change_curve is None:
+            self.init_curves()
+        group_mean_score_change_curve = self.group_mean_score_change_curve
         total_loans = {}
         total_utility = {}
         for group in groups:
-            group_mean_score_change_curve[group.name] = [0]
-            market.loans[group.name] = [0]
-            market.utility[group.name] = [0]
-            total_loans[group.name] = 0
-            total_utility[group.name] = 0
+            total_loans[group.name] = market.loans[group.name][-1]
+            total_utility[group.name] = market.utility[group.name][-1]
 
         #run through simulation steps
         for step in range(0, steps):
-            print("############### STEP "+ str(market.step) + " -> " + str(market.step+1) + " ##################" )
+            self.log("############### STEP "+ str(market.step) + " -> " + str(market.step+1) + " ##################" )
             utilities = {}
             utility_curves = {}
             N_loans = {}
             step_loans = 0
             step_applicants = 0
+            profile.begin_step(market.step)
+            for i in range(len(groups)):
+                groups[i].rng = self.get_rng(STEP_STREAM, market.step, i)
 
             ### Before ###
-            selection_rates, max_util = market.get_selection_rate(banks, groups)
+            with profile.phase('selection/' + market.policy):
+                selection_rates, max_util = market.get_selection_rate(banks, groups)
             for bank in banks:
                 bank.set_selection_rate(selection_rates[bank.name])
                 utilities[bank.name] = {}
@@ -101,44 +131,19 @@ class Simulation:
 
             ### During ###
             for group in groups:
-                for bank in banks:
-                    utilities[bank.name][group.name] = 0
-                    utility_curves[bank.name][group.name] = []
-                    N_loans[bank.name][group.name] = 0
-
-                #select part of customer base at random according to group loan demand
-                applicants = np.sort(random.sample(range(0, group.size), int(group.size*group.loan_demand)))
-                step_applicants += len(applicants)
-                #go over all selected customers in the group
-                for j in applicants:
-                    best_bank = None
-                    best_interest_rate = np.Infinity
-
-                    # check which bank gives best interest rate
-                    for k in range(len(banks)):
-                        if j/group.size <= banks[k].group_selection_rate[group.name]:
-                            expected_applicant_score = banks[k].get_expected_applicant_score(market, group.applicants[j].score)
-                            interest_rate = banks[k].score_interest_rates[expected_applicant_score]
-
-                            if interest_rate < best_interest_rate and interest_rate < group.applicants[j].ir_limit:
-                                best_interest_rate = interest_rate
-                                best_bank = k
-
-                    #print(best_bank)
-                    if best_bank is not None:
-                        #get loan outcome and change score
-                        step_loans += 1
-                        total_loans[group.name] += 1
-                        N_loans[banks[best_bank].name][group.name] += 1
-                        loan_outcome = group.applicants[j].get_repay_outcome(market)
-                        expected_applicant_score = banks[best_bank].get_expected_applicant_score(market, group.applicants[j].score)
-
-                        #get bank utility
-                        interest_rate = banks[best_bank].score_interest_rates[group.applicants[j].score]
-                        utility_change = banks[best_bank].get_applicant_utility(interest_rate, loan_outcome)
-                        utilities[banks[best_bank].name][group.name] += utility_change
-                        total_utility[group.name] += utility_change
-                        utility_curves[banks[best_bank].name][group.name].append(utilities[banks[best_bank].name][group.name])
+                with profile.phase('allocation'):
+                    N_applicants, group_loans, group_utilities, group_utility_curves = self.give_loans(group)
+                profile.count('applicants_sampled', N_applicants)
+                profile.count('loans_issued', np.sum(group_loans))
+                step_applicants += N_applicants
+                step_loans += int(np.sum(group_loans))
+                total_loans[group.name] += int(np.sum(group_loans))
+                total_utility[group.name] += float(np.sum(group_utilities))
+
+                for k in range(len(banks)):
+                    N_loans[banks[k].name][group.name] = group_loans[k]
+                    utilities[banks[k].name][group.name] = group_utilities[k]
+                    utility_curves[banks[k].name][group.name] = group_utility_curves[k]
 
                 for bank in banks:
                     if market.step == 0:
@@ -147,86 +152,99 @@ class Simulation:
                     else:
                         bank.N_loan_curves[group.name].append(bank.N_loan_curves[group.name][-1] + N_loans[bank.name][group.name])
                         bank.total_utility_curves[group.name].append(bank.total_utility_curves[group.name][-1] + utilities[bank.name][group.name])
-                group.sort_by_score()
+                with profile.phase('re_sort'):
+                    group.sort_by_score()
                 group_mean_score_change_curve[group.name].append(group.get_mean_score_change())
-                print(group.name + " group mean score change: " + str(group.get_mean_score_change()))
+                self.log(group.name + " group mean score change: " + str(group.get_mean_score_change()))
 
             market.step += 1
 
             ### After ###
             #adjust interest rate, we will need market share and utilities for this
-            for bank in banks:
-
-                bank_clients = 0
-                total_clients = 0
-                max_expected_utility = 0
-                real_utility = 0
-                #calculate market share and utilities
-                for group in groups:
-                    bank.real_group_utility_curve[group.name] = utility_curves[bank.name][group.name]
-                    total_clients += group.size * group.loan_demand * bank.group_selection_rate[group.name]
-                    bank_clients += len(bank.real_group_utility_curve[group.name])
-                    max_expected_utility += np.max(bank.expected_group_utility_curve[group.name])* group.loan_demand
-
-                    if len(bank.real_group_utility_curve[group.name])>0:
-                        real_utility += bank.real_group_utility_curve[group.name][-1]
-
-                bank.market_share = bank_clients/total_clients
-                #change interest rate according to actual market share and utility
-                if bank.market_share >= 1/len(banks) and real_utility >= max_expected_utility/len(banks):
-                    bank.change_interest_rate(bank.interest_change_up, market)
-                elif bank.market_share < 1/len(banks):
-                    bank.change_interest_rate(bank.interest_change_down, market)
-
-                print(bank.name + " bank - Market share: "  + str(bank.market_share) + ", Interest rate: " + str(bank.interest_rate_range))
+            with profile.phase('bank_adaptation'):
+                for bank in banks:
 
-                market.max_irates[bank.name].append(bank.interest_rate_range[0])
-                market.min_irates[bank.name].append(bank.interest_rate_range[1])
+                    bank_clients = 0
+                    total_clients = 0
+                    max_expected_utility = 0
+                    real_utility = 0
+                    #calculate market share and utilities
+                    for group in groups:
+                        bank.real_group_utility_curve[group.name] = utility_curves[bank.name][group.name]
+                        total_clients += group.size * group.loan_demand * bank.group_selection_rate[group.name]
+                        bank_clients += N_loans[bank.name][group.name]
+                        max_expected_utility += np.max(bank.expected_group_utility_curve[group.name])* group.loan_demand
+                        real_utility += utilities[bank.name][group.name]
+
+                    bank.market_share = bank_clients/total_clients
+                    #change interest rate according to actual market share and utility
+                    if bank.market_share >= 1/len(banks) and real_utility >= max_expected_utility/len(banks):
+                        bank.change_interest_rate(bank.interest_change_up, market)
+                    elif bank.market_share < 1/len(banks):
+                        bank.change_interest_rate(bank.interest_change_down, market)
+
+                    self.log(bank.name + " bank - Market share: "  + str(bank.market_share) + ", Interest rate: " + str(bank.interest_rate_range))
+
+                    market.max_irates[bank.name].append(bank.interest_rate_range[0])
+                    market.min_irates[bank.name].append(bank.interest_rate_range[1])
 
             for group in groups:
                 market.loans[group.name].append(total_loans[group.name])
                 market.utility[group.name].append(total_utility[group.name])
 
+            if on_step is not None:
+                on_step(self, group_mean_score_change_curve)
+
             #market.plot_market_situation_oligo(banks, groups, group_mean_score_change_curve)
         return banks, groups, group_mean_score_change_curve
 
-    def prepare_initial_group_data(self, group_instances):
-        group_names = list(group.name for group in group_instances)
-        all_cdfs, performance, totals = fico.get_FICO_data(data_dir=DATA_DIR)
-        cdfs = all_cdfs[group_names]
-        cdf_groups = np.transpose(cdfs.values)
+    def init_curves(self):
+        market=self.market
+        for bank in self.banks:
+            market.max_irates[bank.name] = []
+            market.min_irates[bank.name] = []
+            market.max_irates[bank.name].append(bank.interest_rate_range[0])
+            market.min_irates[bank.name].append(bank.interest_rate_range[1])
 
-        scores = cdfs.index
-        scores_list = scores.tolist()
-        scores_repay = cdfs.index
+            for group in self.groups:
+                bank.N_loan_curves[group.name] = []
+                bank.total_utility_curves[group.name] = []
+
+        self.group_mean_score_change_curve = {}
+        for group in self.groups:
+            self.group_mean_score_change_curve[group.name] = [0]
+            market.loans[group.name] = [0]
+            market.utility[group.name] = [0]
+        return self.group_mean_score_change_curve
 
-        repays = performance[group_names]
+    def prepare_initial_group_data(self, group_settings):
+        group_names = list(group['name'] for group in group_settings)
+        #parsed once per process, groups look up their repay probabilities in it
+        fico_data = fico.load_FICO_data(data_dir=DATA_DIR)
+        totals = fico_data.get_totals()
+
+        repays = fico_data
 
         ##### comment to use dataset totals (too many people)
-        for group in group_instances:
-            totals[group.name] = group.size
+        for group in group_settings:
+            totals[group['name']] = group['size']
         ####
 
         group_totals = np.zeros(len(group_names), dtype=np.int32)
         for i in range(0,len(group_names)):
             group_totals[i] = int(totals[group_names[i]])
 
-        pis = np.zeros(cdf_groups.shape)
+        #reference scores are cached per group and size and shared read only, groups copy them into their own arrays
+        ref_applicant_scores = []
         applicant_totals = np.zeros(len(group_names), dtype=np.int32)
-
         for i in range(0, len(group_names)):
-            pis[i] = sf.get_pmf(cdf_groups[i])
-            applicant_totals[i] = np.sum(np.round(pis[i]*group_totals[i]))
-        print("Reference group totals: " + str(group_totals))
-        print("Calculated group totals: " + str(applicant_totals))
+            ref_applicant_scores.append(sf.get_group_ref_applicants(fico_data, group_names[i], int(group_totals[i])))
+            applicant_totals[i] = ref_applicant_scores[i].size
+        self.log("Reference group totals: " + str(group_totals))
+        self.log("Calculated group totals: " + str(applicant_totals))
 
         #demographic statistics
-        group_ratio = np.array((applicant_totals[0], applicant_totals[1]))
-        group_size_ratio = group_ratio/group_ratio.sum()
-        print("Group size ratio: " + str(group_size_ratio))
-
-        pis_total = np.round(pis*group_totals[:, None])
-
-        ref_applicant_scores = sf.get_ref_applicants(applicant_totals, pis_total, scores_list)
+        group_size_ratio = applicant_totals/applicant_totals.sum()
+        self.log("Group size ratio: " + str(group_size_ratio))
 
         return repays, applicant_totals, ref_applicant_scores
\ No newline at end of file
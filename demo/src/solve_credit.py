@@ -1,20 +1,18 @@
 """Solve for loan thresholds under fairness criteria"""
 
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 def binary_search(f, target, left=1e-5, right=1 - 1e-5, tol=1e-8):
     """Binary search implementation"""
-    midpoint = (left + right) * .5
-    if abs(midpoint - left) < tol:
-        return midpoint
-    elif f(midpoint) < target:
-        return binary_search(f, target, midpoint, right, tol)
-    elif f(midpoint) >= target:
-        return binary_search(f, target, left, midpoint, tol)
-    else:
-        print("Error - we should never get down here")
+    while True:
+        midpoint = (left + right) * .5
+        if abs(midpoint - left) < tol:
+            return midpoint
+        elif f(midpoint) < target:
+            left = midpoint
+        else:
+            right = midpoint
 
 
 def a_max(f, lst):
@@ -28,34 +26,59 @@ def a_max(f, lst):
 
 def ternary_maximize(f, left=1e-5, right=1 - 1e-5, tol=1e-5):
     """ternary search on the equalized criterion (loan rate, ppv, etc.)"""
-    m_1 = (2. / 3) * left + (1. / 3) * right
-    m_2 = (1. / 3) * left + (2. / 3) * right
-    if abs(m_1 - m_2) < tol:
-        return a_max(f, [m_1, m_2])
-    if f(m_1) < f(m_2):
-        return ternary_maximize(f, m_1, right, tol)
-    if f(m_1) >= f(m_2):
-        return ternary_maximize(f, left, m_2, tol)
-    else:
-        print("Error - we should never get down here")
+    while True:
+        m_1 = (2. / 3) * left + (1. / 3) * right
+        m_2 = (1. / 3) * left + (2. / 3) * right
+        if abs(m_1 - m_2) < tol:
+            return a_max(f, [m_1, m_2])
+        if f(m_1) < f(m_2):
+            left = m_1
+        else:
+            right = m_2
+
+
+def grid_maximize(f, left=1e-5, right=1 - 1e-5, tol=1e-5, points=65):
+    """maximizes a unimodal f that takes an array of candidates,
+    every iteration evaluates one batch and keeps the interval around the best candidate"""
+    while True:
+        candidates = np.linspace(left, right, points)
+        best = int(np.argmax(f(candidates)))
+        if right - left < tol:
+            return candidates[best]
+        left, right = candidates[max(best - 1, 0)], candidates[min(best + 1, points - 1)]
+
+
+def rate_to_position(rate, pdf):
+    """where a loan rate (scalar or array) ends when loaning from the highest score down:
+    index into the reversed pdf of the last loaned score and the loaned fraction of it"""
+    reversed_pdf = pdf[::-1]
+    cdf = np.cumsum(reversed_pdf)
+    rate = np.asarray(rate, dtype=float)
+    index = np.searchsorted(cdf, rate, side='right')
+    full = index >= len(pdf)
+    index = np.minimum(index, len(pdf) - 1)
+    below = np.where(index > 0, cdf[index - 1], 0)
+    fraction = np.divide(rate - below, reversed_pdf[index], out=np.ones(rate.shape), where=~full)
+    return index, fraction
 
 
 def rate_to_loans(rate, pdf):
-    """takes in a loan rate between 0 and 1 and a pdf
+    """takes in a loan rate between 0 and 1 (or an array of them) and a pdf
     returns a vector of the optimal loaning per score
     that achieves the rate"""
-    output = np.zeros(len(pdf))
-    total = 0
-    for i in range(len(pdf)):
-        if pdf[-i - 1] + total > rate:
-            thing = rate - total
-            output[-i - 1] = thing / pdf[-i - 1]
-            return output
-        else:
-            output[-i - 1] = 1
-            total = total + pdf[-i - 1]
+    index, fraction = rate_to_position(rate, pdf)
+    positions = np.arange(len(pdf))
+    index = index[..., None]
+    output = np.where(positions < index, 1., np.where(positions == index, fraction[..., None], 0.))
+    return output[..., ::-1]
+
 
-    return output
+def rate_to_sum(rate, pdf, values):
+    """sum of values * loans of a loan rate (scalar or array), the loans are not built"""
+    index, fraction = rate_to_position(rate, pdf)
+    reversed_values = values[::-1]
+    cumulative = np.append(0, np.cumsum(reversed_values))
+    return cumulative[index] + fraction * reversed_values[index]
 
 
 def loans_to_rate(loans, pdf):
@@ -65,22 +88,29 @@ def loans_to_rate(loans, pdf):
 
 def rate_to_tp(rate, pdf, perf):
     """computes the tp of a given loan rate"""
-    loans = rate_to_loans(rate, pdf)
-    return loans_to_tp(loans, pdf, perf)
+    return rate_to_sum(rate, pdf, pdf * perf) / np.sum(pdf * perf)
 
 
 def loans_to_tp(loans, pdf, perf):
     """get true positive rate"""
     would_pay = np.sum(pdf * perf)
-    will_pay = np.sum(pdf * perf * loans)
+    will_pay = np.sum(pdf * perf * loans, axis=-1)
     return will_pay / would_pay
 
 
 def tp_to_loan_rate(tp, pdf, perf):
-    """get acceptance rate from true positive rate"""
-    f = lambda t: rate_to_tp(t, pdf, perf)
-    rate = binary_search(f, target=tp)
-    return rate
+    """get acceptance rate from true positive rate (scalar or array),
+    the lowest rate reaching it within the bounds of the former binary search"""
+    reversed_pdf = pdf[::-1]
+    reversed_pay = (pdf * perf)[::-1]
+    cdf = np.cumsum(reversed_pdf)
+    will_pay = np.cumsum(reversed_pay)
+    target = np.asarray(tp, dtype=float) * will_pay[-1]
+    index = np.minimum(np.searchsorted(will_pay, target), len(pdf) - 1)
+    below = np.where(index > 0, will_pay[index - 1], 0)
+    fraction = np.divide(target - below, reversed_pay[index], out=np.ones(target.shape), where=reversed_pay[index] > 0)
+    rate = np.where(index > 0, cdf[index - 1], 0) + np.clip(fraction, 0, 1) * reversed_pdf[index]
+    return np.clip(rate, 1e-5, 1 - 1e-5)
 
 
 def tp_to_loans(tp, pdf, perf):
@@ -90,6 +120,24 @@ def tp_to_loans(tp, pdf, perf):
     return loans
 
 
+def utilities_to_break_even(utility_repaid, utility_default):
+    """repay probability at which a loan breaks even (scalars or arrays, e.g. of the banks' utilities)"""
+    utility_repaid = np.asarray(utility_repaid, dtype=float)
+    utility_default = np.asarray(utility_default, dtype=float)
+    return utility_default / (utility_default - utility_repaid)
+
+
+def get_pareto_front(profits, outcomes):
+    """mask of the points that no other point beats in both profit and outcome"""
+    profits = np.asarray(profits, dtype=float)
+    outcomes = np.asarray(outcomes, dtype=float)
+    order = np.lexsort((-outcomes, -profits))
+    best_outcomes = np.maximum.accumulate(outcomes[order])
+    front = np.zeros(profits.size, dtype=bool)
+    front[order] = np.append(True, outcomes[order][1:] > best_outcomes[:-1])
+    return front
+
+
 class fairness_data:
     """@param perf[i][j] = performance of class i, score j
        @param pdf[i][j] = fraction of class i w/ score j
@@ -112,23 +160,28 @@ class fairness_data:
         self.pdf = pdf
 
     def loans_from_rate(self, rate):
-        """get loans from rate"""
-        loans = np.zeros(self.pdf.shape)
-        for i in range(self.num_groups):
-            loans[i] = rate_to_loans(rate, self.pdf[i])
-        return loans
+        """get loans from rate, rows=groups (after the shape of rate if it is an array)"""
+        return np.stack([rate_to_loans(rate, self.pdf[i]) for i in range(self.num_groups)], axis=-2)
 
     def loans_from_tp(self, tp):
-        """get loans from true positive rate"""
-        loans = np.zeros(self.pdf.shape)
-        for i in range(self.num_groups):
-            loans[i] = tp_to_loans(tp, self.pdf[i], self.perf[i])
-        return loans
+        """get loans from true positive rate, rows=groups (after the shape of tp if it is an array)"""
+        return np.stack([tp_to_loans(tp, self.pdf[i], self.perf[i]) for i in range(self.num_groups)], axis=-2)
 
     def compute_profit(self, break_even, loans):
         """compute profit"""
-        in_groups_prof = np.sum((self.perf - break_even) * loans * self.pdf, axis=1)
-        return np.dot(self.props, in_groups_prof)
+        in_groups_prof = np.sum((self.perf - break_even) * loans * self.pdf, axis=-1)
+        return np.dot(in_groups_prof, self.props)
+
+    def profit_from_rates(self, break_even, rates):
+        """profit of every given loan rate, the same for all groups"""
+        return sum(self.props[i] * rate_to_sum(rates, self.pdf[i], (self.perf[i] - break_even) * self.pdf[i])
+                   for i in range(self.num_groups))
+
+    def profit_from_tps(self, break_even, tps):
+        """profit of every given true positive rate, the same for all groups"""
+        return sum(self.props[i] * rate_to_sum(tp_to_loan_rate(tps, self.pdf[i], self.perf[i]), self.pdf[i],
+                                               (self.perf[i] - break_even) * self.pdf[i])
+                   for i in range(self.num_groups))
 
     def get_break_even(self, break_even):
         """get break even"""
@@ -147,14 +200,15 @@ class fairness_data:
             print(self.loans_from_rate(rate))
             profits.append(f_prof(rate))
         print(ternary_maximize(f_prof))
+        from demo.src.plotting import plt
         plt.plot(rates, profits)
         return rates, profits
 
     def demographic_loans(self, break_even=None):
         """return loan policy under demographic parity"""
         break_even = self.get_break_even(break_even)
-        f_prof = lambda rate: self.compute_profit(break_even, self.loans_from_rate(rate))
-        target_rate = ternary_maximize(f_prof)
+        f_prof = lambda rates: self.profit_from_rates(break_even, rates)
+        target_rate = grid_maximize(f_prof)
         return self.loans_from_rate(target_rate)
 
     def max_profit_loans(self, break_even=None):
@@ -165,6 +219,56 @@ class fairness_data:
     def equal_opp_loans(self, break_even=None):
         """return loan policy under equal opportunity"""
         break_even = self.get_break_even(break_even)
-        f_prof = lambda tp: self.compute_profit(break_even, self.loans_from_tp(tp))
-        target_tp = ternary_maximize(f_prof)
+        f_prof = lambda tps: self.profit_from_tps(break_even, tps)
+        target_tp = grid_maximize(f_prof)
         return self.loans_from_tp(target_tp)
+
+    def rate_candidates(self):
+        """loan rates at which the loans of some group move on to the next score,
+        profit and outcomes of a rate shared by all groups are linear in between"""
+        rates = [np.append(0, np.cumsum(self.pdf[i][::-1])) for i in range(self.num_groups)]
+        return np.unique(np.clip(np.concatenate(rates), 0, 1))
+
+    def tp_candidates(self):
+        """true positive rates at which the loans of some group move on to the next score"""
+        tps = [np.append(0, np.cumsum((self.pdf[i] * self.perf[i])[::-1])) / np.sum(self.pdf[i] * self.perf[i])
+               for i in range(self.num_groups)]
+        return np.unique(np.clip(np.concatenate(tps), 0, 1))
+
+    def frontier(self, break_evens, score_changes):
+        """profit, loan rates and outcomes of the max profit, demographic parity and equal opportunity loans
+        for every break even value, keys are the market policy names
+        @param score_changes[i][j] = expected score change of a loan to class i, score j
+        the candidate thresholds are the same for all break even values, profits of all of them are one matrix"""
+        break_evens = np.asarray(break_evens, dtype=float).ravel()
+        points = np.arange(break_evens.size)
+        pays = [self.pdf[i] * self.perf[i] for i in range(self.num_groups)]
+        changes = [self.pdf[i] * score_changes[i] for i in range(self.num_groups)]
+        frontier = {}
+
+        # the same loan rate or true positive rate for all groups, the best candidate for every break even value
+        rates = self.rate_candidates()
+        tps = self.tp_candidates()
+        candidates = {'Dem. parity': [rates] * self.num_groups,
+                      'Equal opportunity': [tp_to_loan_rate(tps, self.pdf[i], self.perf[i]) for i in range(self.num_groups)]}
+        for policy, group_rates in candidates.items():
+            will_pay = np.array([rate_to_sum(group_rates[i], self.pdf[i], pays[i]) for i in range(self.num_groups)])
+            loaned = np.array([rate_to_sum(group_rates[i], self.pdf[i], self.pdf[i]) for i in range(self.num_groups)])
+            outcomes = np.array([rate_to_sum(group_rates[i], self.pdf[i], changes[i]) for i in range(self.num_groups)])
+            profits = np.dot(self.props, will_pay)[None, :] - break_evens[:, None] * np.dot(self.props, loaned)[None, :]
+            best = np.argmax(profits, axis=1)
+            frontier[policy] = {'break_even': break_evens, 'profit': profits[points, best],
+                                'rates': loaned[:, best].T, 'outcomes': outcomes[:, best].T}
+
+        # max profit loans to every score repaying at least at break even, summed over the scores by performance
+        will_pay = np.zeros((break_evens.size, self.num_groups))
+        loaned = np.zeros((break_evens.size, self.num_groups))
+        outcomes = np.zeros((break_evens.size, self.num_groups))
+        for i in range(self.num_groups):
+            order = np.argsort(self.perf[i], kind='stable')
+            loaned_scores = len(order) - np.searchsorted(self.perf[i][order], break_evens)
+            for sums, values in ((will_pay, pays[i]), (loaned, self.pdf[i]), (outcomes, changes[i])):
+                sums[:, i] = np.append(0, np.cumsum(values[order][::-1]))[loaned_scores]
+        frontier['Max. utility'] = {'break_even': break_evens, 'profit': np.dot(will_pay - break_evens[:, None] * loaned, self.props),
+                                    'rates': loaned, 'outcomes': outcomes}
+        return frontier
@@ -1,6 +1,6 @@
+import functools
 import numpy as np
 import random
-import matplotlib.pyplot as plt
 
 # intersection computation
 def perp( a ) :
@@ -22,6 +22,7 @@ def seg_intersect(a1,a2, b1,b2) :
 
 #get score mapping to interest rates for different banks
 def get_i_rates(interest_rates, score_range, bank_names):
+    from demo.src.plotting import plt
     plt.figure(0)
     x_axis = np.linspace(score_range[0],score_range[1],score_range[1]-score_range[0]+1, dtype=int)
     tmp_rates = []
@@ -95,8 +96,7 @@ def get_next_ref_applicant_scores(ref_applicants, score_interest_rates, applican
 def get_pmf(cdf):
     pis = np.zeros(cdf.size)
     pis[0] = cdf[0]
-    for score in range(cdf.size-1):
-        pis[score+1] = cdf[score+1] - cdf[score]
+    pis[1:] = np.diff(cdf)
     return pis
 
 
@@ -124,35 +124,33 @@ def pis2cdf(pis):
     return cdf
 
 # get reference applicant scores
+# every score bin gets int(pis_total) applicants spread evenly over the half distances to its neighbouring scores
 def get_ref_applicants(applicant_totals, pis_total, scores_list):
+    scores = np.asarray(scores_list, dtype=float)
+    halves = np.diff(scores)/2
+    diff_down = np.concatenate(([0], halves))
+    diff_up = np.concatenate((halves, [0]))
     ref_applicants = []
     for i in range(0,len(pis_total)):
-        pointer = 0
+        counts = np.maximum(np.asarray(pis_total[i]).astype(int), 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            steps = np.where(counts != 0, (diff_down+diff_up)/pis_total[i], 0)
+        #position of every applicant inside its score bin
+        starts = np.cumsum(counts) - counts
+        positions = np.arange(counts.sum()) - np.repeat(starts, counts)
+        values = np.round(np.repeat(scores-diff_down, counts) + positions*np.repeat(steps, counts))
         ref_applicants.append(np.zeros(applicant_totals[i]))
-        for j in range(0, len(pis_total[i])):
-            diff_up = 0
-            diff_down = 0
-            if pis_total[i][j] == 0:
-                step = 0
-            else:
-                if j == 0:
-                    diff_up = (scores_list[j+1]-scores_list[j])/2
-                    step = diff_up/pis_total[i][j]
-                elif j == len(pis_total[i])-1:
-                    diff_down = (scores_list[j]-scores_list[j-1])/2
-                    step = diff_down/pis_total[i][j]
-                else:
-                    diff_down = (scores_list[j]-scores_list[j-1])/2
-                    diff_up = (scores_list[j+1]-scores_list[j])/2
-                    step = (diff_down+diff_up)/pis_total[i][j]
+        ref_applicants[i][:values.size] = values[:applicant_totals[i]]
+    return ref_applicants
 
-            for k in range(0,int(pis_total[i][j])):
-                if j == 0:
-                    ref_applicants[i][pointer] = np.round(scores_list[j] + k*step) 
-                else:
-                    ref_applicants[i][pointer] = np.round(scores_list[j]-diff_down + k*step)
-                pointer += 1
-    
+
+# reference applicant scores of one group of given size, read only and shared by all simulations with the same group
+@functools.lru_cache(maxsize=64)
+def get_group_ref_applicants(fico_data, group_name, group_total):
+    pis_total = np.round(get_pmf(fico_data.get_cdfs([group_name])[0])*group_total)
+    applicant_total = int(np.sum(pis_total))
+    ref_applicants = get_ref_applicants([applicant_total], [pis_total], fico_data.cdf_scores)[0]
+    ref_applicants.setflags(write=False)
     return ref_applicants
 
 
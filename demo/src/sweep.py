@@ -0,0 +1,135 @@
+import itertools
+import json
+import multiprocessing
+import os
+import traceback
+
+import numpy as np
+
+from demo.src.scenario import complete_scenario, set_setting
+from demo.src.simulation import Simulation
+from demo.src.replication import get_replicate_series
+
+#grid key choosing the seed of a point instead of a setting, e.g. {'seed': range(10)} for replicates
+SEED_KEY = 'seed'
+
+
+#expands a grid {setting path: values} (see scenario.set_setting) into a list of points,
+#every point is a dict of the grid settings, the last setting of the grid changes fastest
+def expand_grid(grid):
+    paths = list(grid)
+    return [dict(zip(paths, values)) for values in itertools.product(*(list(grid[path]) for path in paths))]
+
+
+def get_point_scenario(scenario, point):
+    for path, value in point.items():
+        if path != SEED_KEY:
+            scenario = set_setting(scenario, path, value)
+    return scenario
+
+
+#point settings as plain python values, so they can be written to json and numpy arrays
+def to_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+#worker of the process pool, runs one point and writes its per step summary to its own part file
+#returns index and error message, None if the point succeeded
+def run_point(task):
+    index, scenario, point, steps, seed, engine, part_path = task
+    try:
+        point_seed = point.get(SEED_KEY, [seed, index])
+        simulation = engine(scenario=get_point_scenario(scenario, point), seed=point_seed, verbose=False)
+        banks, groups, group_mean_score_change_curve = simulation.run_oligopoly(steps)
+        series = get_replicate_series(simulation.market, banks, groups, group_mean_score_change_curve)
+        columns = {curve + '/' + name: np.asarray(values, dtype=float) for (curve, name), values in series.items()}
+        #written under a temporary name first, a part file exists only for a finished point
+        with open(part_path + '.tmp', 'wb') as part_file:
+            np.savez(part_file, **columns)
+        os.replace(part_path + '.tmp', part_path)
+        return index, None
+    except Exception:
+        return index, traceback.format_exc()
+
+
+#Grid of simulations written to a result directory, points already written by an interrupted sweep are not run again
+class Sweep:
+    def __init__(self, scenario, grid, steps, out_dir, seed=0, engine=Simulation, verbose=True):
+        self.scenario = complete_scenario(scenario)
+        self.grid = {path: [to_value(value) for value in values] for path, values in grid.items()}
+        self.points = expand_grid(self.grid)
+        self.steps = steps
+        self.seed = seed
+        self.engine = engine
+        self.out_dir = out_dir
+        self.parts_dir = os.path.join(out_dir, 'points')
+        self.table_path = os.path.join(out_dir, 'table.npz')
+        self.failures_path = os.path.join(out_dir, 'failures.json')
+        self.failures = {}
+        self.verbose = verbose
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    #the setting is stored with the results, resuming a sweep with a different setting would mix results
+    def write_setting(self):
+        os.makedirs(self.parts_dir, exist_ok=True)
+        setting = {'scenario': self.scenario, 'grid': self.grid, 'steps': self.steps, 'seed': self.seed, 'engine': self.engine.__name__}
+        setting_path = os.path.join(self.out_dir, 'sweep.json')
+        if os.path.exists(setting_path):
+            with open(setting_path) as setting_file:
+                if json.load(setting_file) != json.loads(json.dumps(setting)):
+                    raise ValueError("Result directory " + self.out_dir + " belongs to a sweep with a different setting")
+        else:
+            with open(setting_path, 'w') as setting_file:
+                json.dump(setting, setting_file, indent=1)
+        return setting
+
+    def get_part_path(self, index):
+        return os.path.join(self.parts_dir, str(index) + '.npz')
+
+    def get_pending_points(self):
+        return [index for index in range(len(self.points)) if not os.path.exists(self.get_part_path(index))]
+
+    #runs all points without a result, failed points are recorded in failures.json and tried again by the next run
+    def run(self, processes=None):
+        self.write_setting()
+        pending = self.get_pending_points()
+        tasks = ((index, self.scenario, self.points[index], self.steps, self.seed, self.engine, self.get_part_path(index)) for index in pending)
+        self.failures = {}
+        with multiprocessing.Pool(processes) as pool:
+            for index, error in pool.imap_unordered(run_point, tasks):
+                if error is not None:
+                    self.failures[index] = {'point': self.points[index], 'error': error}
+                    self.log("Sweep point " + str(index) + " failed: " + error.strip().splitlines()[-1])
+        with open(self.failures_path, 'w') as failures_file:
+            json.dump(self.failures, failures_file, indent=1)
+        return self.write_table()
+
+    #one row per (scenario, step) of every finished point: scenario index, step, grid settings and per step summaries
+    def write_table(self):
+        point_columns = []
+        finished = [index for index in range(len(self.points)) if os.path.exists(self.get_part_path(index))]
+        rows = self.steps + 1
+        for index in finished:
+            with np.load(self.get_part_path(index)) as part:
+                values = {'scenario': np.full(rows, index, dtype=np.int32), 'step': np.arange(rows, dtype=np.int32)}
+                for path, value in self.points[index].items():
+                    values[path] = np.full(rows, value)
+                values.update({name: part[name].astype(np.float32) for name in part.files})
+            point_columns.append(values)
+        #points with other bank or group names have no values in the columns of the others
+        names = list(dict.fromkeys(name for values in point_columns for name in values))
+        table = {name: np.concatenate([values.get(name, np.full(rows, np.nan, dtype=np.float32)) for values in point_columns]) for name in names}
+        np.savez_compressed(self.table_path, **table)
+        return table
+
+
+def load_table(path):
+    with np.load(path) as table:
+        return {name: table[name] for name in table.files}
+
+
+def run_sweep(scenario, grid, steps, out_dir, seed=0, processes=None, engine=Simulation, verbose=True):
+    return Sweep(scenario, grid, steps, out_dir, seed, engine, verbose).run(processes)
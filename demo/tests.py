@@ -1,3 +1,433 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from .history import History_writer, get_history
+
+from .src.scenario import get_default_scenario
+from .src.simulation import Simulation
+from .src.histogram_simulation import Histogram_simulation
+from .src.replication import Replication_summary
+from .src.job_queue import run_job, Job_cancelled
+from .src.checkpoint import save_checkpoint, load_checkpoint, CHECKPOINT_VERSION
+from .src.benchmark import get_solver_data
+from .src.sweep import Sweep, load_table
+from .src import fico
+from .src import solve_credit as sc
+from .src import distribution_to_loans_outcomes as dlo
+
+POLICIES = ("Max. utility", "Dem. parity", "Equal opportunity")
+
+
+#final mean score change and loans of every group for each seed, rows=seeds
+def run_seeds(engine, policy, steps, seeds):
+    scenario = get_default_scenario()
+    scenario['market']['policy'] = policy
+    results = []
+    for seed in seeds:
+        simulation = engine(scenario=scenario, seed=seed, verbose=False)
+        banks, groups, group_mean_score_change_curve = simulation.run_oligopoly(steps)
+        results.append([group_mean_score_change_curve[group.name][-1] for group in groups] +
+                       [simulation.market.loans[group.name][-1] for group in groups])
+    return np.array(results, dtype=float)
+
+
+class Histogram_simulation_tests(SimpleTestCase):
+    #the engines draw differently, so their means over the same seeds agree within a few standard errors
+    def test_agrees_with_run_oligopoly(self):
+        seeds = range(20)
+        for policy in POLICIES:
+            with self.subTest(policy=policy):
+                agents = run_seeds(Simulation, policy, 10, seeds)
+                histograms = run_seeds(Histogram_simulation, policy, 10, seeds)
+                standard_errors = np.sqrt((agents.var(axis=0, ddof=1) + histograms.var(axis=0, ddof=1))/len(seeds))
+                np.testing.assert_array_less(np.abs(agents.mean(axis=0) - histograms.mean(axis=0)), 4*standard_errors + 1e-9)
+
+    #with the whole group applying every selected position is drawn, so both engines give the same loans per bank
+    def test_loans_fill_selected_positions(self):
+        scenario = get_default_scenario()
+        for group_setting in scenario['groups']:
+            group_setting['loan_demand'] = 1
+        for policy in POLICIES:
+            scenario['market']['policy'] = policy
+            for seed in range(10):
+                agents = Simulation(scenario=scenario, seed=seed, verbose=False)
+                histograms = Histogram_simulation(scenario=scenario, seed=seed, verbose=False)
+                agents.run_oligopoly(1)
+                histograms.run_oligopoly(1)
+                for agent_bank, histogram_bank in zip(agents.banks, histograms.banks):
+                    with self.subTest(policy=policy, seed=seed, bank=agent_bank.name):
+                        self.assertEqual(agent_bank.N_loan_curves, histogram_bank.N_loan_curves)
+
+
+class Constrained_selection_tests(SimpleTestCase):
+    #a group without expected repayers has no weight for equal opportunity, it gets no loans and the other groups are still selected
+    def test_group_without_weight_is_not_selected(self):
+        scenario = get_default_scenario()
+        scenario['market']['policy'] = "Equal opportunity"
+        simulation = Simulation(scenario=scenario, seed=0, verbose=False)
+        empty_group = simulation.groups[-1]
+        empty_group.score_repay_prob = np.zeros_like(empty_group.score_repay_prob)
+        with np.errstate(divide='raise', invalid='raise'):
+            selection_rates, max_util = simulation.market.get_selection_rate(simulation.banks, simulation.groups)
+        for bank in simulation.banks:
+            self.assertEqual(selection_rates[bank.name][empty_group.name], 0)
+            self.assertTrue(np.isfinite(max_util[bank.name]))
+            self.assertGreater(selection_rates[bank.name][simulation.groups[0].name], 0)
+
+
+#curves, loans and rates of a simulation which a resumed run has to reproduce
+def get_run_curves(simulation):
+    market = simulation.market
+    curves = {'mean_score_change': simulation.group_mean_score_change_curve, 'loans': market.loans, 'utility': market.utility,
+              'max_irates': market.max_irates, 'min_irates': market.min_irates}
+    for bank in simulation.banks:
+        curves['N_loans/' + bank.name] = bank.N_loan_curves
+        curves['total_utility/' + bank.name] = bank.total_utility_curves
+        curves['interest_rate_range/' + bank.name] = list(bank.interest_rate_range)
+    return curves
+
+
+class Checkpoint_tests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'checkpoint.npz')
+
+    #a run checkpointed after some steps and resumed ends exactly like the same run without interruption
+    def test_resume_reproduces_uninterrupted_run(self):
+        for engine in (Simulation, Histogram_simulation):
+            for policy in POLICIES:
+                with self.subTest(engine=engine.__name__, policy=policy):
+                    scenario = get_default_scenario()
+                    scenario['market']['policy'] = policy
+                    uninterrupted = engine(scenario=scenario, seed=3, verbose=False)
+                    uninterrupted.run_oligopoly(6)
+                    interrupted = engine(scenario=scenario, seed=3, verbose=False)
+                    interrupted.run_oligopoly(3)
+                    save_checkpoint(interrupted, self.path)
+                    resumed = load_checkpoint(self.path)
+                    self.assertIs(type(resumed), engine)
+                    resumed.run_oligopoly(3)
+                    self.assertEqual(resumed.market.step, 6)
+                    self.assertEqual(get_run_curves(resumed), get_run_curves(uninterrupted))
+
+    def test_other_version_is_rejected(self):
+        save_checkpoint(Simulation(scenario=get_default_scenario(), seed=0, verbose=False), self.path)
+        with np.load(self.path) as checkpoint:
+            arrays = dict(checkpoint)
+        meta = json.loads(arrays['meta'].tobytes())
+        meta['version'] = CHECKPOINT_VERSION - 1
+        arrays['meta'] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+        with open(self.path, 'wb') as checkpoint_file:
+            np.savez_compressed(checkpoint_file, **arrays)
+        with self.assertRaisesRegex(ValueError, "Unsupported checkpoint version"):
+            load_checkpoint(self.path)
+
+
+class Sweep_tests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.out_dir = directory.name
+
+    #the second point has no such policy, so it fails every time
+    def get_sweep(self, steps=3):
+        return Sweep(get_default_scenario(), {'market.policy': ["Max. utility", "No policy"]}, steps, self.out_dir, verbose=False)
+
+    def test_failures_are_recorded_and_finished_points_are_not_run_again(self):
+        sweep = self.get_sweep()
+        table = sweep.run(processes=1)
+        np.testing.assert_array_equal(table['scenario'], np.zeros(4))
+        np.testing.assert_array_equal(table['step'], np.arange(4))
+        with open(os.path.join(self.out_dir, 'failures.json')) as failures_file:
+            failures = json.load(failures_file)
+        self.assertEqual(list(failures), ['1'])
+        self.assertEqual(failures['1']['point'], {'market.policy': "No policy"})
+        self.assertEqual(list(sweep.failures), [1])
+
+        finished = os.stat(sweep.get_part_path(0)).st_mtime_ns
+        resumed = self.get_sweep()
+        self.assertEqual(resumed.get_pending_points(), [1])
+        resumed.run(processes=1)
+        self.assertEqual(os.stat(resumed.get_part_path(0)).st_mtime_ns, finished)
+        self.assertEqual(list(resumed.failures), [1])
+        for name, column in load_table(sweep.table_path).items():
+            np.testing.assert_array_equal(column, table[name])
+
+    def test_directory_of_other_setting_is_refused(self):
+        self.get_sweep().write_setting()
+        with self.assertRaisesRegex(ValueError, "different setting"):
+            self.get_sweep(steps=4).run(processes=1)
+
+
+class FICO_cache_tests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_dir = directory.name + '/'
+        for name in fico.FILES.values():
+            shutil.copy('demo/data/' + name, self.data_dir)
+        self.addCleanup(fico._loaded.pop, os.path.abspath(self.data_dir), None)
+
+    def assert_same_data(self, data, other):
+        self.assertEqual(data.groups, other.groups)
+        self.assertEqual(data.totals, other.totals)
+        for name in ('cdf_scores', 'cdfs', 'performance_scores', 'performance'):
+            np.testing.assert_array_equal(getattr(data, name), getattr(other, name))
+        for group in data.groups:
+            np.testing.assert_array_equal(data.get_repay_prob_mapping(group, fico.DEFAULT_SCORE_RANGE),
+                                          other.get_repay_prob_mapping(group, fico.DEFAULT_SCORE_RANGE))
+
+    def load_from_cache(self):
+        fico._loaded.pop(os.path.abspath(self.data_dir), None)
+        return fico.load_FICO_data(self.data_dir)
+
+    def test_cached_data_equals_parsed_data(self):
+        parsed = fico.load_FICO_data(self.data_dir)
+        self.assertTrue(os.path.exists(self.data_dir + fico.CACHE_FILE))
+        self.assert_same_data(self.load_from_cache(), parsed)
+        self.assert_same_data(self.load_from_cache(), fico.compile_FICO_data(self.data_dir))
+
+    def test_edited_file_invalidates_cache(self):
+        data = fico.load_FICO_data(self.data_dir)
+        path = self.data_dir + fico.PERF
+        with open(path) as performance_file:
+            lines = performance_file.read().splitlines(keepends=True)
+        lines[1] = '0,50.00,99.67,99.05,94.77\n'
+        with open(path, 'w') as performance_file:
+            performance_file.writelines(lines)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        edited = fico.load_FICO_data(self.data_dir)
+        white = edited.groups.index('White')
+        self.assertNotEqual(data.performance[0, white], edited.performance[0, white])
+        self.assertAlmostEqual(edited.performance[0, white], 0.5)
+        self.assert_same_data(edited, fico.compile_FICO_data(self.data_dir))
+        self.assert_same_data(self.load_from_cache(), edited)
+
+
+#the loop solvers of solve_credit before they were vectorized, the reference of the closed form solvers
+def reference_rate_to_loans(rate, pdf):
+    output = np.zeros(len(pdf))
+    total = 0
+    for i in range(len(pdf)):
+        if pdf[-i - 1] + total > rate:
+            output[-i - 1] = (rate - total) / pdf[-i - 1]
+            return output
+        output[-i - 1] = 1
+        total = total + pdf[-i - 1]
+    return output
+
+
+def reference_tp_to_loan_rate(tp, pdf, perf):
+    left, right = 1e-5, 1 - 1e-5
+    while True:
+        midpoint = (left + right) * .5
+        if abs(midpoint - left) < 1e-8:
+            return midpoint
+        if np.sum(pdf * perf * reference_rate_to_loans(midpoint, pdf)) / np.sum(pdf * perf) < tp:
+            left = midpoint
+        else:
+            right = midpoint
+
+
+def reference_ternary_maximize(f, left=1e-5, right=1 - 1e-5, tol=1e-5):
+    while True:
+        m_1 = (2. / 3) * left + (1. / 3) * right
+        m_2 = (1. / 3) * left + (2. / 3) * right
+        if abs(m_1 - m_2) < tol:
+            return m_2 if f(m_2) > f(m_1) else m_1
+        if f(m_1) < f(m_2):
+            left = m_1
+        else:
+            right = m_2
+
+
+BREAK_EVENS = (0.5, 0.7, 0.8, 0.9, 0.95)
+
+
+class Solve_credit_tests(SimpleTestCase):
+    def setUp(self):
+        data = get_solver_data()
+        self.scores, self.pis, self.perf, self.ratio = data['scores'], data['pis'], data['perf'], data['group_size_ratio']
+        self.fairness_data = sc.fairness_data(self.perf, self.pis, self.ratio, None)
+
+    def get_profit(self, break_even, loans):
+        return np.dot(self.ratio, np.sum((self.perf - break_even) * loans * self.pis, axis=1))
+
+    def test_positions_match_loops(self):
+        for i, pdf in enumerate(self.pis):
+            for rate in np.linspace(0, 1, 41):
+                np.testing.assert_allclose(sc.rate_to_loans(rate, pdf), reference_rate_to_loans(rate, pdf), rtol=0, atol=1e-12)
+            for tp in np.linspace(0.05, 0.95, 19):
+                self.assertAlmostEqual(sc.tp_to_loan_rate(tp, pdf, self.perf[i]), reference_tp_to_loan_rate(tp, pdf, self.perf[i]), delta=1e-7)
+
+    #the maximizers search a finer grid than the ternary search, so the profit is at least the former one and the loan rates agree
+    def test_loans_are_at_least_as_profitable_as_ternary_search(self):
+        for break_even in BREAK_EVENS:
+            with self.subTest(break_even=break_even):
+                get_dempar_loans = lambda rate: np.array([reference_rate_to_loans(rate, pdf) for pdf in self.pis])
+                get_eqopp_loans = lambda tp: np.array([reference_rate_to_loans(reference_tp_to_loan_rate(tp, pdf, perf), pdf)
+                                                       for pdf, perf in zip(self.pis, self.perf)])
+                for loans, get_loans in ((self.fairness_data.demographic_loans(break_even), get_dempar_loans),
+                                         (self.fairness_data.equal_opp_loans(break_even), get_eqopp_loans)):
+                    reference = get_loans(reference_ternary_maximize(lambda target: self.get_profit(break_even, get_loans(target))))
+                    self.assertGreaterEqual(self.get_profit(break_even, loans), self.get_profit(break_even, reference) - 1e-12)
+                    np.testing.assert_allclose(np.sum(loans * self.pis, axis=1), np.sum(reference * self.pis, axis=1), rtol=0, atol=1e-4)
+                np.testing.assert_array_equal(self.fairness_data.max_profit_loans(break_even), np.trunc(self.perf + 1 - break_even))
+
+
+    #the frontier picks the best candidate threshold, the per break even solvers search around it
+    def test_frontier_matches_solvers(self):
+        moves = dlo.get_expected_moves(self.perf, self.scores)
+        frontier = self.fairness_data.frontier(BREAK_EVENS, moves)
+        solvers = {'Max. utility': self.fairness_data.max_profit_loans, 'Dem. parity': self.fairness_data.demographic_loans,
+                   'Equal opportunity': self.fairness_data.equal_opp_loans}
+        for policy, solver in solvers.items():
+            for j, break_even in enumerate(BREAK_EVENS):
+                with self.subTest(policy=policy, break_even=break_even):
+                    loans = solver(break_even)
+                    profit = self.get_profit(break_even, loans)
+                    self.assertGreaterEqual(frontier[policy]['profit'][j], profit - 1e-12)
+                    self.assertAlmostEqual(frontier[policy]['profit'][j], profit, delta=1e-9)
+                    np.testing.assert_allclose(frontier[policy]['rates'][j], np.sum(loans * self.pis, axis=1), rtol=0, atol=1e-7)
+                    np.testing.assert_allclose(frontier[policy]['outcomes'][j], np.sum(loans * self.pis * moves, axis=1), rtol=0, atol=1e-5)
+
+
+#the per score loops of distribution_to_loans_outcomes before the (groups x scores) grid, for two groups
+def reference_cumulative_curve(f, pi, scores):
+    curve = np.zeros(scores.size)
+    curve[0] = f(scores[-1]) * pi[-1]
+    for i in range(1, scores.size):
+        curve[i] = f(scores[-(i + 1)]) * pi[-(i + 1)] + curve[i - 1]
+    return curve
+
+
+def reference_utility_curves_dempar(util, cdfs, group_size_ratio, scores):
+    util_total = np.zeros([2, scores.size])
+    cdfs = np.array([(1 - cdf)[::-1] for cdf in cdfs])
+    for i_a in range(scores.size):
+        i_b = dlo.find_nearest(cdfs[1], cdfs[0, i_a])
+        util_total[0, i_a] = group_size_ratio[0] * util[0, i_a] + group_size_ratio[1] * util[1, i_b]
+    for i_b in range(scores.size):
+        i_a = dlo.find_nearest(cdfs[0], cdfs[1, i_b])
+        util_total[1, i_b] = group_size_ratio[0] * util[0, i_a] + group_size_ratio[1] * util[1, i_b]
+    return util_total
+
+
+def reference_mean_movement_threshold(pi, scores, loan_repay_fn, score_change_fns):
+    running_sum = 0
+    for i, s in enumerate(reversed(scores)):
+        x = len(scores) - 1 - i
+        move = pi[x] * dlo.exp_move(s, loan_repay_fn, move_vec=score_change_fns)
+        if running_sum + move < 0:
+            return s if i == 0 else s + (-running_sum / move) * abs(scores[x] - scores[x + 1])
+        running_sum += pi[x] * dlo.exp_move(s, loan_repay_fn)
+    return s
+
+
+class Outcome_curve_tests(SimpleTestCase):
+    def setUp(self):
+        self.data = get_solver_data()
+
+    def test_curves_match_loops(self):
+        scores, pis, ratio, utils, impacts = (self.data[key] for key in ('scores', 'pis', 'group_size_ratio', 'utils', 'impacts'))
+        repay_fns = self.data['loan_repaid_probs']
+        rhos = dlo.get_rhos(repay_fns, scores)
+        np.testing.assert_array_equal(rhos, [[repay_fn(score) for score in scores] for repay_fn in repay_fns])
+
+        for i, repay_fn in enumerate(repay_fns):
+            reference = reference_cumulative_curve(lambda x: dlo.exp_move(x, repay_fn, move_vec=impacts), pis[i], scores)
+            np.testing.assert_allclose(dlo.get_outcome_curve(repay_fn, pis[i], scores, impacts), reference, rtol=1e-12, atol=1e-9)
+            self.assertAlmostEqual(dlo.get_mean_movement_threshold(pis[i], scores, repay_fn, impacts),
+                                   reference_mean_movement_threshold(pis[i], scores, repay_fn, impacts), delta=1e-9)
+
+        util = dlo.get_utility_curve(repay_fns, pis, scores, utils)
+        reference = [reference_cumulative_curve(lambda x: dlo.bank_util(x, repay_fn, utils), pis[i], scores) for i, repay_fn in enumerate(repay_fns)]
+        np.testing.assert_allclose(util, reference, rtol=1e-12, atol=1e-12)
+
+        cdfs = self.data['cdfs']
+        np.testing.assert_allclose(dlo.get_utility_curves_dempar(util, cdfs.copy(), ratio, scores),
+                                   reference_utility_curves_dempar(util, cdfs, ratio, scores), rtol=1e-12, atol=1e-12)
+        rescaled_pis = pis * rhos / np.sum(pis * rhos, axis=1, keepdims=True)
+        np.testing.assert_allclose(dlo.get_utility_curves_eqopp(util, repay_fns, pis, ratio, scores),
+                                   reference_utility_curves_dempar(util, np.cumsum(rescaled_pis, axis=1), ratio, scores), rtol=1e-12, atol=1e-12)
+
+    def test_thresholds_from_taus_match_loop(self):
+        scores = self.data['scores']
+        data = sc.fairness_data(self.data['perf'], self.data['pis'], self.data['group_size_ratio'], 0.8)
+        for taus in (data.max_profit_loans(), data.demographic_loans(), data.equal_opp_loans()):
+            reference = []
+            for tau in taus:
+                x = np.amin(np.where(tau > 0))
+                reference.append(scores[x] + (1 - tau[x]) * np.abs(scores[x + 1] - scores[x]))
+            np.testing.assert_allclose(dlo.get_thresholds_from_taus(taus, scores), reference)
+
+
+class Replication_summary_tests(SimpleTestCase):
+    def test_quantiles_are_exact_for_kept_replicates(self):
+        values = np.random.default_rng(0).normal(size=(40, 30))
+        summary = Replication_summary(values.shape[1], exact_replicates=64)
+        for n, row in enumerate(values, start=1):
+            summary.add(row)
+            for quantile, estimate in summary.get_quantiles().items():
+                np.testing.assert_allclose(estimate, np.quantile(values[:n], quantile, axis=0))
+        np.testing.assert_allclose(summary.mean, values.mean(axis=0))
+        np.testing.assert_allclose(summary.get_std(), values.std(axis=0, ddof=1))
+
+    #past the kept replicates the P-square estimates stay close to the exact quantiles
+    def test_quantiles_continue_after_kept_replicates(self):
+        values = np.random.default_rng(1).normal(size=(2000, 50))
+        summary = Replication_summary(values.shape[1], exact_replicates=64)
+        for row in values:
+            summary.add(row)
+        for quantile, estimate in summary.get_quantiles().items():
+            errors = np.abs(estimate - np.quantile(values, quantile, axis=0))
+            self.assertLess(errors.mean(), 0.05)
+            self.assertLess(errors.max(), 0.3)
+
+
+#cancels its job once the job has run the given number of steps
+class Cancel_after:
+    def __init__(self, progress, steps):
+        self.progress = progress
+        self.steps = steps
+
+    def __contains__(self, job_id):
+        return self.progress.get(job_id, 0) >= self.steps
+
+
+class Job_history_tests(TestCase):
+    def run_job(self, job_id, steps, cancelled):
+        progress = {}
+        history = History_writer('session', job_id, chunk_steps=4)
+        return run_job(job_id, get_default_scenario(), steps, 0, progress, [], cancelled(progress), history)
+
+    def test_history_is_written_while_running(self):
+        result = self.run_job('done', 10, lambda progress: {})
+        steps, values = get_history('session', 'done')
+        np.testing.assert_array_equal(steps, np.arange(11))
+        for group in result['groups_plot']:
+            np.testing.assert_allclose(values['mean_score_change/' + group['name']], group['mean_score_change'])
+        for name, loans in result['loans'].items():
+            np.testing.assert_array_equal(values['loans/' + name], loans)
+        for name, irates in result['max_irates'].items():
+            np.testing.assert_allclose(values['max_irates/' + name], irates)
+
+    def test_cancelled_run_keeps_its_history(self):
+        with self.assertRaises(Job_cancelled):
+            self.run_job('cancelled', 10, lambda progress: Cancel_after(progress, 5))
+        steps, values = get_history('session', 'cancelled')
+        np.testing.assert_array_equal(steps, np.arange(6))
+
+    def test_history_view_rejects_invalid_ranges(self):
+        for query in ('start=a', 'stop=1.5', 'max_points=0', 'start=-1'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get('/demo/history/missing/?' + query).status_code, 400)
+        self.assertEqual(self.client.get('/demo/history/missing/?start=0&stop=5&max_points=2').status_code, 404)
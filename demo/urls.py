@@ -6,4 +6,10 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('setting/', views.setting, name='setting'),
     path('model/', views.model, name='model'),
+    path('jobs/', views.job_list, name='job_list'),
+    path('jobs/<str:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<str:job_id>/cancel/', views.job_cancel, name='job_cancel'),
+    path('jobs/<str:job_id>/stream/', views.job_stream, name='job_stream'),
+    path('history/', views.history, name='history'),
+    path('history/<str:run_id>/', views.history, name='run_history'),
 ]
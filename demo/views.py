@@ -1,13 +1,26 @@
 from django.shortcuts import render
-from django.http import HttpResponseRedirect
-import matplotlib.pyplot as plt
+from django.http import HttpResponseRedirect, JsonResponse, Http404, StreamingHttpResponse
+from django.views.decorators.http import require_POST
 import json
+import time
 
 # Create your views here.
 from django.conf import settings
 
 from .models import Market, Policy, Bank, Applicant_group, MarketForm, BankForm, Applicant_groupForm
-from .src.simulation import Simulation
+from .src.scenario import get_session_scenario
+from .src.job_queue import get_job_queue, DONE
+from .history import History_writer, init_history_worker, get_last_run, get_history
+
+#seconds between checks for new steps of a streamed job
+STREAM_INTERVAL = 0.2
+#a stream ends after this many seconds so it does not hold a worker for the whole run, the browser reconnects after STREAM_RETRY ms
+STREAM_SECONDS = 25
+STREAM_RETRY = 500
+
+#queue of simulation runs of this web process, SIMULATION_WORKERS setting limits its worker processes
+def get_simulation_jobs():
+    return get_job_queue(getattr(settings, 'SIMULATION_WORKERS', None), init_history_worker)
 
 def index(request):
     if not request.session.exists(request.session.session_key):
@@ -25,28 +38,126 @@ def index(request):
         # create a form instance and populate it with data from the request:
 
         if 'start' in request.POST:
-            simulation=Simulation(session_id)
-            steps=request.POST.get("steps")
-            sim_banks, sim_groups, group_mean_score_change_curve = simulation.run_oligopoly(int(steps))
-            groups_plot =[]
-            step_array = []
-            for group in sim_groups:
-                n ,bins, patches = plt.hist(group.get_scores(),range = [market.score_range_min,market.score_range_max])
-                bins =bins.tolist()
-                bins.pop(0)
-                step_array=list(range(len(group_mean_score_change_curve[group.name])))
-                groups_plot.append({'name':group.name, 'color':group.color, 'hist':n.tolist(), 'hist_labels':bins, 'mean_score_change':group_mean_score_change_curve[group.name]})
+            #the run is queued and executed by a worker process, the page polls the job status
+            steps=int(request.POST.get("steps"))
+            queue = get_simulation_jobs()
+            #curves of the run are kept as the session's history, written by the worker while the run is live
+            job_id = queue.submit(session_id, get_session_scenario(session_id), steps, history=History_writer)
+            return HttpResponseRedirect('../demo/?job=' + job_id)
 
+    job_id = request.GET.get("job")
+    if job_id is not None:
+        queue = get_simulation_jobs()
+        job = queue.get_job(session_id, job_id)
+        if job is None:
+            raise Http404("No such simulation job")
+        job_info = queue.get_info(job, with_result=True)
+        context = {'session_id': session_id, 'group_names':group_names, 'group_sizes':group_sizes, "groups":groups, 'market':market,
+            'banks':banks, 'job':job_info, 'step_array':[], 'bank_rates':get_bank_rates(banks), 'group_colors':get_group_colors(groups)}
+        if job_info['status'] == DONE:
+            result = job_info['result']
+            context.update({'groups_plot':result['groups_plot'], 'steps':job.steps, 'step_array':result['step_array'],
+                'bank_rates':get_bank_rates(banks, result)})
+        return render(request, 'index.html', context)
 
-            context = {'session_id': session_id, 'groups_plot':groups_plot, 'steps':steps, 'market':market, "groups":groups,
-                'banks':banks,'step_array':step_array, }
+    context = {'session_id': session_id, 'group_names':group_names, 'group_sizes':group_sizes, "groups":groups, 'market':market, 'banks':banks,
+        'step_array':[], 'bank_rates':get_bank_rates(banks), 'group_colors':get_group_colors(groups)}
 
-            return render(request, 'index.html', context)
+    return render(request, 'index.html', context)
 
+#interest rate curves of the banks for the chart, empty curves are filled by streamed steps
+def get_bank_rates(banks, result=None):
+    return json.dumps([{'name':bank.name, 'color':bank.color,
+        'max_irates':result['max_irates'].get(bank.name, []) if result else [],
+        'min_irates':result['min_irates'].get(bank.name, []) if result else []} for bank in banks])
 
-    context = {'session_id': session_id, 'group_names':group_names, 'group_sizes':group_sizes, "groups":groups, 'market':market, 'banks':banks}
+def get_group_colors(groups):
+    return json.dumps({group.name:group.color for group in groups})
 
-    return render(request, 'index.html', context)
+def job_list(request):
+    if not request.session.exists(request.session.session_key):
+        return JsonResponse({'jobs': []})
+    return JsonResponse({'jobs': get_simulation_jobs().list_jobs(request.session.session_key)})
+
+def job_status(request, job_id):
+    queue = get_simulation_jobs()
+    job = queue.get_job(request.session.session_key, job_id)
+    if job is None:
+        raise Http404("No such simulation job")
+    return JsonResponse(queue.get_info(job, with_result='result' in request.GET))
+
+#number of steps the browser already received, a missing or malformed header starts from the first step
+def get_last_event_id(request):
+    try:
+        return max(int(request.headers.get('Last-Event-ID', 0)), 0)
+    except ValueError:
+        return 0
+
+#server-sent events with one summary per finished step, the last event reports the final job status
+#the stream ends after STREAM_SECONDS while the job runs, the reconnecting browser continues after the last step it received
+def job_stream(request, job_id):
+    queue = get_simulation_jobs()
+    job = queue.get_job(request.session.session_key, job_id)
+    if job is None:
+        raise Http404("No such simulation job")
+
+    def events(sent):
+        deadline = time.monotonic() + STREAM_SECONDS
+        yield 'retry: ' + str(STREAM_RETRY) + '\n\n'
+        while True:
+            #status is checked before reading, so no step finished before the end event is missed
+            finished = queue.is_finished(job)
+            for summary in queue.get_summaries(job, sent):
+                sent += 1
+                yield 'id: ' + str(sent) + '\nevent: step\ndata: ' + json.dumps(summary) + '\n\n'
+            if finished:
+                yield 'event: end\ndata: ' + json.dumps(queue.get_info(job)) + '\n\n'
+                return
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(STREAM_INTERVAL)
+
+    response = StreamingHttpResponse(events(get_last_event_id(request)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@require_POST
+def job_cancel(request, job_id):
+    queue = get_simulation_jobs()
+    job = queue.get_job(request.session.session_key, job_id)
+    if job is None:
+        raise Http404("No such simulation job")
+    return JsonResponse({'id': job_id, 'status': queue.cancel(job)})
+
+#integer query parameter, ValueError if it is not an integer of at least minimum
+def get_int_parameter(request, name, default=None, minimum=0):
+    if name not in request.GET:
+        return default
+    try:
+        value = int(request.GET[name])
+    except ValueError:
+        value = minimum - 1
+    if value < minimum:
+        raise ValueError(name + " has to be an integer of at least " + str(minimum))
+    return value
+
+#per step curves of a run (the last run of the session by default), ?series=...&start=&stop=&max_points= select a part
+def history(request, run_id=None):
+    session_id = request.session.session_key
+    if run_id is None:
+        run_id = get_last_run(session_id)
+    series = request.GET.getlist('series') or None
+    try:
+        start = get_int_parameter(request, 'start', 0)
+        stop = get_int_parameter(request, 'stop')
+        max_points = get_int_parameter(request, 'max_points', minimum=1)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    steps, values = get_history(session_id, run_id, series, start, stop, max_points=max_points)
+    if run_id is None or not values:
+        raise Http404("No history for this run")
+    return JsonResponse({'run_id': run_id, 'steps': steps.tolist(), 'series': {name: curve.tolist() for name, curve in values.items()}})
 
 def setting(request):
 # if this is a POST request we need to process the form data